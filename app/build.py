@@ -0,0 +1,56 @@
+import polars as pl
+
+from app.loaders import (
+    LEVEL_02_PATH,
+    LEVEL_05_PATH,
+    SOURCE_FINGERPRINT_KEY,
+    build_path,
+    file_fingerprint,
+)
+from app.keys import HOUSEHOLD_KEY_FIELDS, PERSON_KEY_FIELDS, check_key_fields
+from app.schema import LEVEL_02_SCHEMA, LEVEL_05_SCHEMA, cast_to_schema
+
+# source -> (final dtypes, sort order, rows per row group)
+# Sorted by District (and Item_Code) the min/max statistics of a row
+# group cover a handful of districts / items, so filters on them skip
+# whole row groups and group-bys see the keys already clustered.
+BUILDS = {
+    LEVEL_02_PATH: (LEVEL_02_SCHEMA, ["District", "FSU_Serial_No", "Sample_Household_No", "Person_Serial_No"], 16_384),
+    LEVEL_05_PATH: (LEVEL_05_SCHEMA, ["District", "Item_Code", "FSU_Serial_No", "Sample_Household_No"], 32_768),
+}
+
+def build_table(source_path, schema:dict, sort_by, row_group_size):
+    """
+    Rewrite a raw parquet file with its final dtypes, sorted, in row
+    groups of `row_group_size` rows with per-column statistics.
+    The fingerprint of the raw file is kept in the file metadata.
+    Fails when a key field does not fit its bits of the packed ids.
+    """
+    lf = cast_to_schema(pl.scan_parquet(source_path), schema)
+    check_key_fields(lf, PERSON_KEY_FIELDS if "Person_Serial_No" in schema else HOUSEHOLD_KEY_FIELDS)
+
+    df = (
+        lf
+        .sort(sort_by)
+        .collect()
+    )
+
+    path = build_path(source_path)
+    df.write_parquet(
+        path,
+        compression="zstd",
+        statistics=True,
+        row_group_size=row_group_size,
+        metadata={SOURCE_FINGERPRINT_KEY: file_fingerprint(source_path)},
+    )
+
+    return path, df
+
+def build_all():
+    for source_path, (schema, sort_by, row_group_size) in BUILDS.items():
+        path, df = build_table(source_path, schema, sort_by, row_group_size)
+        print(f"{path}: {df.height} rows, {df.estimated_size() / 1024**2:.1f} MB in memory")
+
+if __name__ == "__main__":
+    # Build command: python -m app.build
+    build_all()
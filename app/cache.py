@@ -0,0 +1,74 @@
+import time
+from collections import OrderedDict
+from threading import Lock
+
+
+class TTLCache:
+    """
+    Bounded LRU cache with time-to-live eviction and hit/miss counters.
+
+    Keys are small tuples built by the caller (dataset fingerprint,
+    filter state, ...), so looking up an entry never hashes a DataFrame.
+    One instance is shared by all Streamlit sessions of the process,
+    hence the lock.
+    """
+
+    def __init__(self, maxsize=128, ttl=3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+
+                # Expired
+                del self._entries[key]
+                self.evictions += 1
+
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_compute(self, key, compute):
+        """
+        Cached value of `key`, calling `compute()` on a miss.
+        """
+        sentinel = object()
+        value = self.get(key, sentinel)
+        if value is sentinel:
+            value = compute()
+            self.set(key, value)
+
+        return value
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
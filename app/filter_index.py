@@ -0,0 +1,178 @@
+from dataclasses import dataclass
+
+import numpy as np
+import polars as pl
+
+# Above this many values a column keeps sorted row-id lists instead of
+# bitmaps: one bitmap costs n_rows / 8 bytes per value, the row-id
+# lists 4 bytes per row whatever the number of values
+BITMAP_MAX_VALUES = 32
+
+
+@dataclass(frozen=True)
+class FilterIndex:
+    """
+    Index over the filter columns of one dataset.
+
+    For every column it keeps the sorted distinct values and the code
+    of every row (position of its value, n_values for nulls). Columns
+    with few values also keep one packed bitmap per value (bit i is set
+    when row i holds that value), stacked as a (n_values,
+    ceil(n_rows / 8)) uint8 matrix. Columns with many values keep the
+    sorted row ids of every value instead, concatenated, with offsets.
+    """
+    n_rows: int
+    values: dict
+    positions: dict
+    codes: dict
+    bitmaps: dict
+    row_lists: dict
+    offsets: dict
+
+    def _rows_of(self, col, pos):
+        return self.row_lists[col][self.offsets[col][pos]:self.offsets[col][pos + 1]]
+
+    def select(self, filter_map:dict, exclude=None):
+        """
+        Sorted row ids matching every selection, None when nothing is
+        selected. "All" selections and the `exclude` column are skipped.
+        Row-id lists are intersected first, the bitmaps of the other
+        selections are then ANDed and tested at those rows only.
+        """
+        mask, row_ids = None, None
+        for col, val in filter_map.items():
+            if val == "All" or col == exclude:
+                continue
+
+            pos = self.positions[col].get(val)
+            if pos is None:
+                # Value not present in the data, nothing can match
+                return np.empty(0, dtype=np.int64)
+
+            if col in self.bitmaps:
+                bitmap = self.bitmaps[col][pos]
+                mask = bitmap.copy() if mask is None else np.bitwise_and(mask, bitmap, out=mask)
+            else:
+                rows = self._rows_of(col, pos)
+                row_ids = rows if row_ids is None else np.intersect1d(row_ids, rows, assume_unique=True)
+
+        if mask is None:
+            return row_ids
+
+        if row_ids is None:
+            return np.flatnonzero(np.unpackbits(mask, count=self.n_rows))
+
+        bits = mask[row_ids >> 3] & (128 >> (row_ids & 7)).astype(np.uint8)
+        return row_ids[bits != 0]
+
+    def row_ids(self, filter_map:dict):
+        """
+        Row ids matching every selection, None when nothing is selected.
+        """
+        return self.select(filter_map)
+
+    def take(self, df, filter_map:dict):
+        """
+        Filter `df` (the frame the index was built on) with a single gather.
+        """
+        row_ids = self.row_ids(filter_map)
+        if row_ids is None:
+            return df
+
+        return df[row_ids]
+
+    def options(self, filter_map:dict):
+        """
+        Cascading option lists: for each column, the values still
+        reachable under the selections made on all the other columns.
+        """
+        options = {}
+        for col, values in self.values.items():
+            row_ids = self.select(filter_map, exclude=col)
+            if row_ids is None:
+                options[col] = values
+                continue
+
+            reachable = np.bincount(self.codes[col][row_ids], minlength=len(values) + 1)
+            options[col] = [val for val, count in zip(values, reachable) if count]
+
+        return options
+
+    def cascade(self, filter_map:dict):
+        """
+        Reset selections that are no longer reachable under the other
+        selections to "All", then return (filter_map, options).
+        Resetting only widens the other selections, so this settles in
+        a few rounds.
+        """
+        filter_map = dict(filter_map)
+        while True:
+            options = self.options(filter_map)
+            stale = [
+                col for col, val in filter_map.items()
+                if val != "All" and val not in options[col]
+            ]
+            if not stale:
+                return filter_map, options
+
+            filter_map[stale[0]] = "All"
+
+
+def _narrowest_uint(max_value):
+    for dtype in (np.uint8, np.uint16, np.uint32):
+        if max_value <= np.iinfo(dtype).max:
+            return dtype
+    return np.uint64
+
+
+def build_filter_index(df, columns, bitmap_max_values=BITMAP_MAX_VALUES):
+    """
+    Build the index once for a dataset.
+    1. Dense rank every column into codes 0..n_values-1 (nulls n_values)
+    2. Few values: set bit (code, row) of the packed matrix, 8 rows per byte
+    3. Many values: stable argsort of the codes gives the sorted row ids
+       of every value, one after the other
+    """
+    codes_df = df.select([
+        (pl.col(col).rank("dense") - 1).cast(pl.UInt32)
+        for col in columns
+    ])
+
+    rows = np.arange(df.height)
+    row_bytes = rows >> 3
+    row_bits = (128 >> (rows & 7)).astype(np.uint8)
+
+    values, positions, all_codes, bitmaps, row_lists, offsets = {}, {}, {}, {}, {}, {}
+    for col in columns:
+        col_values = df[col].unique().drop_nulls().sort().to_list()
+        n_values = len(col_values)
+        codes = codes_df[col].fill_null(n_values).to_numpy().astype(_narrowest_uint(n_values))
+        has_value = codes < n_values
+
+        if n_values <= bitmap_max_values:
+            bitmap = np.zeros((n_values, (df.height + 7) // 8), dtype=np.uint8)
+            np.bitwise_or.at(
+                bitmap,
+                (codes[has_value], row_bytes[has_value]),
+                row_bits[has_value],
+            )
+            bitmaps[col] = bitmap
+        else:
+            order = np.argsort(codes, kind="stable").astype(np.int32)
+            counts = np.bincount(codes, minlength=n_values + 1)[:n_values]
+            row_lists[col] = order[:counts.sum()]
+            offsets[col] = np.concatenate([[0], np.cumsum(counts)])
+
+        values[col] = col_values
+        positions[col] = {val: pos for pos, val in enumerate(col_values)}
+        all_codes[col] = codes
+
+    return FilterIndex(
+        n_rows=df.height,
+        values=values,
+        positions=positions,
+        codes=all_codes,
+        bitmaps=bitmaps,
+        row_lists=row_lists,
+        offsets=offsets,
+    )
@@ -0,0 +1,49 @@
+import polars as pl
+
+# Fields of the household key, most significant first, with the bits
+# each one gets in the packed id. Questionnaire_No is left out: it is
+# constant within a level and typed differently in BL02 and BL05, so
+# it would only stop the two levels from joining.
+HOUSEHOLD_KEY_FIELDS = [
+    ("FSU_Serial_No", 20),
+    ("Sample_SU_No", 8),
+    ("Sample_Sub_Division_No", 4),
+    ("Second_Stage_Stratum_No", 4),
+    ("Sample_Household_No", 8),
+]
+
+PERSON_KEY_FIELDS = HOUSEHOLD_KEY_FIELDS + [("Person_Serial_No", 8)]
+
+def _field(col):
+    # Sample_Sub_Division_No is mostly null (and text in the raw
+    # files), null packs as 0
+    return pl.col(col).cast(pl.UInt64).fill_null(0)
+
+def packed_key(fields, name):
+    """
+    One UInt64 holding every field of `fields` in its own bit range.
+    Equal ids mean equal composite keys, and the ids sort like the keys.
+    """
+    key = pl.lit(0, dtype=pl.UInt64)
+    for col, bits in fields:
+        key = key * (1 << bits) + _field(col)
+
+    return key.alias(name)
+
+def check_key_fields(lf, fields):
+    """
+    Raise ValueError when a field holds a value that does not fit its bits.
+    """
+    row = lf.select([
+        _field(col).max().alias(col) for col, _ in fields
+    ]).collect().row(0, named=True)
+
+    for col, bits in fields:
+        if row[col] is not None and row[col] >= 1 << bits:
+            raise ValueError(f"{col} value {row[col]} does not fit the {bits} bits of the packed key")
+
+def household_id():
+    return packed_key(HOUSEHOLD_KEY_FIELDS, "household_id")
+
+def person_id():
+    return packed_key(PERSON_KEY_FIELDS, "person_id")
@@ -0,0 +1,129 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+from sklearn.cluster import KMeans, MiniBatchKMeans
+from sklearn.metrics import silhouette_score
+from threadpoolctl import threadpool_limits
+
+K_RANGE = range(2, 11)
+
+# Above this many rows MiniBatchKMeans is used instead of KMeans
+MINIBATCH_THRESHOLD = 50_000
+
+# Up to this many rows the whole sweep takes well under a second in
+# process, less than handing the matrix to the worker processes
+IN_PROCESS_MAX_ROWS = 5_000
+
+# Silhouette is O(n^2), it is estimated on a random sample of rows
+SILHOUETTE_SAMPLE_SIZE = 5_000
+
+
+@dataclass(frozen=True)
+class KMeansSweep:
+    """
+    KMeans fitted for every k of the sweep: inertia for the elbow chart,
+    sampled silhouette score and the cluster label of every row.
+    """
+    ks: list
+    inertia: dict
+    silhouette: dict
+    labels: dict
+
+    def to_dataframe(self):
+        return pd.DataFrame({
+            "k": self.ks,
+            "Inertia": [self.inertia[k] for k in self.ks],
+            "Silhouette": [self.silhouette[k] for k in self.ks],
+        })
+
+
+def _fit_k(X, k, minibatch, random_state):
+    if minibatch:
+        model = MiniBatchKMeans(k, random_state=random_state, n_init="auto", batch_size=4096)
+    else:
+        model = KMeans(k, random_state=random_state, n_init="auto")
+    labels = model.fit_predict(X)
+
+    silhouette = np.nan
+    if 1 < len(np.unique(labels)) < len(X):
+        silhouette = silhouette_score(
+            X,
+            labels,
+            sample_size=min(SILHOUETTE_SAMPLE_SIZE, len(X)),
+            random_state=random_state,
+        )
+
+    return k, float(model.inertia_), float(silhouette), labels.astype(np.int16)
+
+
+def _fit_k_in_worker(X, k, minibatch, random_state):
+    # One process per k, so every fit runs single threaded
+    with threadpool_limits(limits=1):
+        return _fit_k(X, k, minibatch, random_state)
+
+
+def kmeans_executor(max_workers=None):
+    """
+    Process pool for the sweeps, meant to be created once per process
+    and reused: spawned workers import numpy and sklearn on their first
+    task, which costs seconds. Spawn, not fork: forking the
+    multithreaded Streamlit server can copy a lock held by another
+    thread into the worker.
+    """
+    max_workers = min(max_workers or os.cpu_count() or 1, len(K_RANGE))
+    return ProcessPoolExecutor(
+        max_workers=max_workers,
+        mp_context=multiprocessing.get_context("spawn"),
+    )
+
+
+def iter_kmeans_fits(X, ks=K_RANGE, random_state=42, pool=None):
+    """
+    (k, inertia, silhouette, labels) of every k, in the order the fits
+    finish. Fits run in `pool` when given and X has more than
+    IN_PROCESS_MAX_ROWS rows, one after the other in process otherwise.
+    Any k that does not fit the number of rows is skipped.
+    """
+    ks = [k for k in ks if k < len(X)]
+    minibatch = len(X) > MINIBATCH_THRESHOLD
+
+    if pool is None or len(X) <= IN_PROCESS_MAX_ROWS:
+        for k in ks:
+            yield _fit_k(X, k, minibatch, random_state)
+        return
+
+    futures = [
+        pool.submit(_fit_k_in_worker, X, k, minibatch, random_state)
+        for k in ks
+    ]
+    for future in as_completed(futures):
+        yield future.result()
+
+
+def kmeans_sweep(X, ks=K_RANGE, random_state=42, pool=None, on_result=None):
+    """
+    Fit k = 2..10, see `iter_kmeans_fits`. While fits are still running,
+    `on_result` gets the sweep of the ks finished so far after each fit,
+    so a page can draw the results as they come.
+    """
+    ks = [k for k in ks if k < len(X)]
+
+    inertia, silhouette, labels = {}, {}, {}
+    for k, k_inertia, k_silhouette, k_labels in iter_kmeans_fits(X, ks, random_state, pool):
+        inertia[k] = k_inertia
+        silhouette[k] = k_silhouette
+        labels[k] = k_labels
+
+        if on_result is not None and len(labels) < len(ks):
+            on_result(KMeansSweep(
+                ks=sorted(labels),
+                inertia=dict(inertia),
+                silhouette=dict(silhouette),
+                labels=dict(labels),
+            ))
+
+    return KMeansSweep(ks=ks, inertia=inertia, silhouette=silhouette, labels=labels)
@@ -0,0 +1,114 @@
+from dataclasses import dataclass
+
+import numpy as np
+import polars as pl
+
+from app.loaders import filter_state
+
+# Partition of the partial sums, every filter on these columns (or on
+# a column constant within them) selects whole cells
+CELL_COLUMNS = ["District", "Sector", "Stratum"]
+
+
+@dataclass(frozen=True)
+class CovariancePartials:
+    """
+    Count, sums and cross-product sums of the features per cell.
+    `cells` row i describes cell i: the cell columns plus every filter
+    column that is constant within a cell (NSS_Region, ...).
+    Partials merge by addition, so the correlation of any selection
+    of cells costs O(cells x features^2) instead of a pass over rows.
+    """
+    features: list
+    cells: pl.DataFrame
+    n: np.ndarray
+    sums: np.ndarray
+    cross: np.ndarray
+
+    def can_merge(self, filter_map:dict):
+        return all(col in self.cells.columns for col, _ in filter_state(filter_map))
+
+    def merge(self, filter_map:dict):
+        """
+        Partials of the cells selected by `filter_map`, which must only
+        use columns of `cells` (see `can_merge`).
+        """
+        mask = np.ones(self.cells.height, dtype=bool)
+        for col, val in filter_state(filter_map):
+            mask &= (self.cells[col] == val).to_numpy()
+
+        return self.n[mask].sum(), self.sums[mask].sum(axis=0), self.cross[mask].sum(axis=0)
+
+    def correlation(self, filter_map:dict):
+        """
+        Pearson matrix of the features, in the layout of `DataFrame.corr`.
+        """
+        n, sums, cross = self.merge(filter_map)
+        if n < 2:
+            return correlation_frame(np.full((len(self.features),) * 2, np.nan), self.features)
+
+        mean = sums / n
+        covariance = (cross - n * np.outer(mean, mean)) / (n - 1)
+        std = np.sqrt(np.diag(covariance))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            corr = covariance / np.outer(std, std)
+
+        return correlation_frame(corr, self.features)
+
+
+def correlation_frame(corr, features):
+    return pl.DataFrame(corr, schema=list(features), orient="row")
+
+
+def cell_attributes(df, filter_columns, cell_columns=CELL_COLUMNS):
+    """
+    Filter columns that hold a single value in every cell, a filter on
+    them selects whole cells too.
+    """
+    candidates = [col for col in filter_columns if col not in cell_columns]
+    if not candidates:
+        return []
+
+    n_unique = (
+        df.group_by(cell_columns)
+        .agg(pl.col(candidates).n_unique())
+        .select(pl.col(candidates).max())
+        .row(0, named=True)
+    )
+    return [col for col in candidates if n_unique[col] == 1]
+
+
+def build_covariance_partials(df, features, filter_columns, cell_columns=CELL_COLUMNS):
+    """
+    All the partials in one group_by over the rows. Nulls become 0,
+    as in the PCA feature matrix.
+    """
+    x = [pl.col(col).fill_null(0).cast(pl.Float64) for col in features]
+    p = len(features)
+    pairs = [(i, j) for i in range(p) for j in range(i, p)]
+    attributes = cell_attributes(df, filter_columns, cell_columns)
+
+    grouped = (
+        df.lazy()
+        .group_by(cell_columns)
+        .agg(
+            *[pl.col(col).first() for col in attributes],
+            pl.len().alias("n"),
+            *[x[i].sum().alias(f"s{i}") for i in range(p)],
+            *[(x[i] * x[j]).sum().alias(f"c{i}_{j}") for i, j in pairs],
+        )
+        .sort(cell_columns)
+        .collect()
+    )
+
+    cross = np.zeros((grouped.height, p, p))
+    for i, j in pairs:
+        cross[:, i, j] = cross[:, j, i] = grouped[f"c{i}_{j}"].to_numpy()
+
+    return CovariancePartials(
+        features=list(features),
+        cells=grouped.select(*cell_columns, *attributes),
+        n=grouped["n"].to_numpy().astype(np.float64),
+        sums=grouped.select([f"s{i}" for i in range(p)]).to_numpy(),
+        cross=cross,
+    )
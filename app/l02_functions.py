@@ -1,4 +1,6 @@
-import time
+import hashlib
+from concurrent.futures.process import BrokenProcessPool
+
 import numpy as np
 import pandas as pd
 import polars as pl
@@ -6,7 +8,22 @@ import plotly.express as px
 import streamlit as st
 from sklearn.preprocessing import StandardScaler, MinMaxScaler
 from sklearn.decomposition import PCA
-from sklearn.cluster import KMeans
+
+from app.cache import TTLCache
+from app.l02_cluster import kmeans_executor, kmeans_sweep
+from app.l02_pca import PCAModel, fit_streaming_pca, project_batches
+from app.l02_sketches import frequency, histogram_box_stats
+from app.loaders import filter_expr, scan_level_02
+from app.plotting import (
+    MAX_SCATTER_POINTS,
+    add_chart_note,
+    add_points_note,
+    box_figure,
+    box_stats_figure,
+    stratified_sample,
+)
+from app.profiling import StageReporter
+from app.weights import weight_of
 
 # Because this are continuous variables
 pca_features = [
@@ -19,37 +36,307 @@ pca_features = [
     "Meals_Other",
     "Meals_On_Payment",
     "Meals_At_Home",
-    "Multiplier" # This is provide by the survey 
 ]
 
-def correlation_df(df, pca_features):
-    corr = df[pca_features].corr()
+# The count charts take `value_counts` frames ([col, count, count_se]),
+# from the summary bundle or the merged sketches
+
+def years_of_education_bar(counts, weight=None):
+    return px.bar(
+        counts,
+        x='Years_of_Education',
+        y='count',
+        error_y='count_se',
+        # The fixed range only fits the unweighted person counts
+        range_y=[0, 8_000] if weight is None else None,
+        title="Year of Education Distribution"
+    )
+
+def internet_education_gender_box(df, weight=None):
+    fig = box_figure(
+        df,
+        'Years_of_Education',
+        x='Used_Internet_Last_30_Days',
+        color='Gender',
+        title="Last used Internet w/ Gender w/ Age",
+        weight=weight,
+    )
+
+    fig.update_layout(showlegend=True)
+
+    fig.update_xaxes(
+        tickvals=[1, 2],
+        ticktext=['Yes', 'No']
+    ) 
+    return fig
+
+def internet_education_box(df, weight=None):
+    fig = box_figure(
+        df,
+        'Years_of_Education',
+        x='Used_Internet_Last_30_Days',
+        title="Relationship b/w Internet Used w/ Year of Edu  ",
+        weight=weight,
+    )
+
+    fig.update_xaxes(
+        tickvals=[1, 2],
+        ticktext=['Yes', 'No']
+    )
+    return fig
+
+def internet_usage_pie(counts, weight=None):
+    fig = px.pie(
+        counts,
+        values='count',
+        names='Used_Internet_Last_30_Days', 
+        title='Internet Usage in Last 30 Days'
+    )
+    
+    fig.update_layout(showlegend=True)
+    return fig
+
+def internet_age_gender_box(df, weight=None):
+    fig = box_figure(
+        df,
+        'Age',
+        x='Used_Internet_Last_30_Days',
+        color='Gender',
+        title="Last used Internet w/ Gender w/ Age",
+        weight=weight,
+    )
+
+    fig.update_layout(showlegend=True)
 
-    fig = px.imshow(
+    fig.update_xaxes(
+        tickvals=[1, 2],
+        ticktext=['Yes', 'No']
+    )
+    return fig
+
+def age_box(df, weight=None):
+    return box_figure(
+        df,
+        'Age',
+        title="Age Boxplot",
+        weight=weight,
+    ) 
+
+def age_histogram(df, weight=None):
+    if weight is None:
+        return px.histogram(df, x='Age', title="Age Distribution")
+
+    population = df.select('Age', weight_of(weight).alias(weight))
+    return px.histogram(population, x='Age', y=weight, histfunc="sum", title="Age Distribution")
+
+def age_count_bar(counts, weight=None):
+    return px.bar(
+        counts,
+        x='Age',
+        y='count',
+        error_y='count_se',
+        text_auto=True,
+        title="Age Count"
+    )
+
+# The same charts from merged histograms of the sketches (see
+# app.l02_sketches), for filters that only select whole cells
+
+def age_box_from_histogram(hist, weight=None):
+    return box_stats_figure(histogram_box_stats(hist, 'Age', weight), 'Age', title="Age Boxplot")
+
+def age_histogram_from_histogram(hist, weight=None):
+    fig = px.histogram(
+        hist.drop_nulls('Age'),
+        x='Age',
+        y=frequency(weight),
+        histfunc="sum",
+        title="Age Distribution"
+    )
+    fig.update_layout(yaxis_title="count" if weight is None else f"sum of {weight}")
+    return fig
+
+def education_level_bar(counts, weight=None):
+    return px.bar(
+        counts,
+        x='Education_Level',
+        y='count',
+        error_y='count_se',
+        text_auto=True,
+        title="Education Level Count",
+        width=800,
+    )
+
+def marital_status_pie(counts, weight=None):
+    fig = px.pie(
+        counts,
+        values='count',
+        names='Marital_Status_label',
+        title="Marital Status Pie Chart"
+    )
+
+    fig.update_layout(showlegend=True)
+    return fig
+
+def marital_status_education_heatmap(df, weight=None):
+    columns = ['Marital_Status', 'Education_Level']
+    weighted = {} if weight is None else dict(z=weight, histfunc="sum")
+    fig = px.density_heatmap(
+        df.select(*columns, *([weight_of(weight).alias(weight)] if weight else [])),
+        x='Marital_Status', 
+        y='Education_Level', 
+        text_auto=True, 
+        title='Marital Status by Education Level',
+        **weighted,
+    )
+
+    fig.update_xaxes(
+        tickvals=[1, 2, 3, 4],
+        ticktext=['Never Married', 'Currently Married', 'Widowed', 'Divorced/Separated']
+    )
+    return fig
+
+def relation_age_gender_box(df, weight=None):
+    fig = box_figure(
+        df,
+        'Age',
+        x='Relation_to_Head',
+        color='Gender',
+        title="Relation to Head w/ Gender w/ Age",
+        weight=weight,
+    )
+    fig.update_layout(width=800)
+    return fig
+
+def gender_pie(counts, weight=None):
+    fig = px.pie(
+        counts,
+        values='count',
+        names='Gender_label',
+        title="Gender Pie Chart"
+    )
+
+    fig.update_layout(showlegend=True)
+    return fig
+
+def age_days_away_scatter(df, weight=None):
+    """
+    Age and days away are small integers, so the rows are binned into
+    their distinct (Age, Days away, Gender) points and sized by count.
+    Every gender keeps all of its rows. With a `weight` the points
+    are sized by the estimated population instead.
+    """
+    count = pl.len() if weight is None else weight_of(weight).sum()
+    binned = (
+        df
+        .group_by(["Age", "Days_Away_From_Home_Last_30_Days", "Gender"])
+        .agg(count.alias("count"))
+        .sort("Gender")
+    )
+    
+    fig = px.scatter(
+        binned,
+        x="Age",
+        y="Days_Away_From_Home_Last_30_Days",
+        symbol="Gender",
+        size="count",
+        hover_data=["count"],
+        title="Relationship between Age and Days Away by Gender",
+        render_mode="webgl"
+    )
+    
+    return add_chart_note(fig, f"{df.height:,} rows binned into {binned.height:,} points")
+
+def correlation_df(df, pca_features, partials=None, filter_map=None):
+    """
+    Correlation of the PCA features (nulls as 0, like the PCA matrix).
+    Merged from the per-cell covariance partials when the filters only
+    select whole cells, computed on the filtered rows otherwise.
+    """
+    if partials is not None and partials.can_merge(filter_map or {}):
+        corr = partials.correlation(filter_map or {})
+    else:
+        corr = df.select(pl.col(pca_features).fill_null(0).cast(pl.Float64)).corr()
+    return corr, correlation_heatmap(corr)
+
+def correlation_heatmap(corr):
+    return px.imshow(
         corr,
         text_auto=".2f",
         aspect="auto",
         title="Feature Correlation Heatmap"
     )
-    
-    return corr, fig
 
 @st.cache_resource
-def apply_pca(df, n_components=10):
-    X = (
-        df
-        .select(pca_features)
-        .fill_null(0)
-        .to_numpy()
-    )
+def load_pca_matrix(path, _reporter=None):
+    """
+    Standardized feature matrix of every row, built once per dataset and
+    shared by the fits of every component count. Returns the fitted
+    StandardScaler and the scaled matrix, filtered subsets are
+    projected from it with `project_rows`.
+    """
+    reporter = _reporter or StageReporter("load_pca_matrix")
+    
+    with reporter.stage("Load"):
+        features = scan_level_02(path).select(pca_features).collect()
+    
+    with reporter.stage("Feature selection"):
+        X = features.fill_null(0).to_numpy().astype(np.float64)
+        del features
         
-    scaler = StandardScaler()
-    X_scaled = scaler.fit_transform(X)
+    with reporter.stage("Scaling"):
+        scaler = StandardScaler()
+        # In place, only the scaled copy is kept
+        X = scaler.fit(X).transform(X, copy=False)
+    return scaler, X
+
+@st.cache_resource
+def apply_pca(path, n_components=10, _reporter=None):
+    """
+    Fit PCA once per dataset and component count, on the shared
+    scaled matrix. Only the fitted model is cached here.
+    """
+    # Stages are only reported when the fit is not served from cache
+    reporter = _reporter or StageReporter("apply_pca")
+    scaler, X_scaled = load_pca_matrix(path, _reporter=reporter)
     
-    pca = PCA(n_components)
-    X_pca = pca.fit_transform(X_scaled)
-    X_pca_scaled = MinMaxScaler().fit_transform(X_pca)
-    return pca, X_pca, X_pca_scaled
+    with reporter.stage("PCA fit"):
+        pca = PCA(n_components)
+        pca.fit(X_scaled)
+    return PCAModel.from_sklearn(pca_features, scaler, pca)
+
+@st.cache_resource
+def apply_streaming_pca(path, n_components=10, _reporter=None):
+    """
+    Out-of-core version of `apply_pca`: the parquet file is streamed
+    batch by batch and only the fitted model is kept.
+    """
+    reporter = _reporter or StageReporter("apply_streaming_pca")
+    
+    with reporter.stage("Streaming moments & PCA fit"):
+        return fit_streaming_pca(scan_level_02(path), pca_features, n_components)
+
+def project_rows(model, X_scaled, row_ids=None):
+    """
+    Project the selected row ids of the scaled feature matrix through
+    the fitted model (a gather and one matrix multiply, no refit).
+    Returns the scores and the scores min-max scaled for clustering.
+    """
+    if row_ids is not None:
+        X_scaled = X_scaled[row_ids]
+    return scale_scores(model.transform_scaled(X_scaled))
+
+def project_streaming(model, path, filter_map:dict):
+    """
+    Out-of-core counterpart of `project_rows`: the filtered rows are
+    streamed from the parquet file and projected batch by batch, the
+    dense feature matrix is never built.
+    """
+    lf = scan_level_02(path).filter(filter_expr(filter_map))
+    return scale_scores(project_batches(model, lf))
+
+def scale_scores(X_pca):
+    return X_pca, MinMaxScaler().fit_transform(X_pca)
 
 def explained_df_on_pca(pca):
     return pd.DataFrame({
@@ -74,7 +361,7 @@ def loadings_df(pca):
         index=pca_features
     )
 
-def pca_gender_2d_graphs(X_pca, df):
+def pca_gender_2d_graphs(X_pca, df, max_points=MAX_SCATTER_POINTS):
     
     pca_df = pd.DataFrame(
         X_pca[:, :2],
@@ -82,18 +369,22 @@ def pca_gender_2d_graphs(X_pca, df):
     )
     pca_df["Gender"] = df["Gender_label"]
     
+    # Above the point budget keep a sample with the same gender shares
+    plot_df, _ = stratified_sample(pca_df, "Gender", max_points)
+    
     fig = px.scatter(
-        pca_df,
+        plot_df,
         x="PC1",
         y="PC2",
         color="Gender",
         opacity=0.6,
-        title="2D PCA Projection"
+        title="2D PCA Projection",
+        render_mode="webgl"
     )
     
-    return fig
+    return add_points_note(fig, len(plot_df), len(pca_df))
 
-def education_pca_3d(X_pca, df):
+def education_pca_3d(X_pca, df, max_points=MAX_SCATTER_POINTS):
     pca_df_3d = pd.DataFrame(
         X_pca[:, :3],
         columns=["PC1", "PC2", "PC3"]
@@ -101,8 +392,11 @@ def education_pca_3d(X_pca, df):
 
     pca_df_3d["Education"] = df["Education_Level_label"]
     
+    # All rows are returned, only the plotted ones are sampled
+    plot_df, _ = stratified_sample(pca_df_3d, "Education", max_points)
+    
     fig = px.scatter_3d(
-        pca_df_3d,
+        plot_df,
         x="PC1",
         y="PC2",
         z="PC3",
@@ -129,19 +423,69 @@ def education_pca_3d(X_pca, df):
         margin=dict(b=120)
     )
 
-    return pca_df_3d, fig
+    return pca_df_3d, add_points_note(fig, len(plot_df), len(pca_df_3d))
 
 @st.cache_resource
-def cluster_and_pca_on_overall_data(X_pca_scaled, pca_df_3d, n_clusters=6):
+def kmeans_pool():
+    # One worker pool per process, shared by every session and sweep
+    return kmeans_executor()
+
+@st.cache_resource
+def kmeans_sweep_cache():
+    return TTLCache(maxsize=32, ttl=3600)
+
+def kmeans_sweep_on_pca(X_pca_scaled, on_result=None, _reporter=None):
+    """
+    KMeans for every k of the slider, fitted once per projection and
+    cached on the content of the projected matrix. Moving the cluster
+    slider only picks stored labels. `on_result` gets the partial
+    sweeps while the fits run (see `kmeans_sweep`).
+    """
+    reporter = _reporter or StageReporter("kmeans_sweep_on_pca")
+    X = np.ascontiguousarray(X_pca_scaled[:, :3])
+    key = (X.shape, hashlib.blake2b(X.tobytes(), digest_size=16).hexdigest())
+
+    sweep = kmeans_sweep_cache().get(key)
+    if sweep is None:
+        with reporter.stage("KMeans sweep", flush=True):
+            try:
+                sweep = kmeans_sweep(X, pool=kmeans_pool(), on_result=on_result)
+            except BrokenProcessPool:
+                # A worker died, start a new pool next time and fit here
+                kmeans_pool.clear()
+                sweep = kmeans_sweep(X)
+        kmeans_sweep_cache().set(key, sweep)
+    return sweep
+
+def elbow_silhouette_graphs(sweep):
+    sweep_df = sweep.to_dataframe()
+    
+    elbow_fig = px.line(
+        sweep_df,
+        x="k",
+        y="Inertia",
+        markers=True,
+        title="KMeans Elbow (Inertia by k)"
+    )
     
-    kmeans = KMeans(n_clusters, random_state=42, n_init="auto")
-    clusters = kmeans.fit_predict(X_pca_scaled[:, :3])
+    silhouette_fig = px.line(
+        sweep_df,
+        x="k",
+        y="Silhouette",
+        markers=True,
+        title="KMeans Silhouette Score by k (sampled)"
+    )
+    
+    return elbow_fig, silhouette_fig
+
+def cluster_and_pca_on_overall_data(pca_df_3d, clusters, max_points=MAX_SCATTER_POINTS):
 
     pca_df_3d["Cluster"] = clusters
     
+    plot_df, _ = stratified_sample(pca_df_3d, "Cluster", max_points)
     
     fig = px.scatter_3d(
-        pca_df_3d,
+        plot_df,
         x="PC1",
         y="PC2",
         z="PC3",
@@ -163,31 +507,4 @@ def cluster_and_pca_on_overall_data(X_pca_scaled, pca_df_3d, n_clusters=6):
         margin=dict(b=120)
     )
 
-    return fig
-
-def loading_animation_pca_time():
-    with st.status("Model training, Cluster and PCA are working", expanded=True) as status:
-        st.toast("Please wait ...", icon="⌛")
-        st.write("Searching for data...")
-        time.sleep(2)
-        st.write("Feature Selection")
-        time.sleep(2)
-        st.write("Correlation and Graphs")
-        time.sleep(2)
-        st.write("Apply PCA")
-        st.toast("Your `no. of components` applied.")
-        time.sleep(4)
-        st.write("Plot Elbow Graph")
-        time.sleep(3)
-        st.write("PCA on Gender graphs completed")
-        time.sleep(2)
-        st.write("PCA on Education graphs completed")
-        time.sleep(2)
-        st.write("KMeans Cluster performing....")
-        st.toast("Your `no of cluster` applied.")
-        time.sleep(5)
-        st.write("Showing everything...")
-        time.sleep(3)
-        status.update(
-            label="🎉 Graphs Ready!", state="complete", expanded=False
-        )
+    return add_points_note(fig, len(plot_df), len(pca_df_3d))
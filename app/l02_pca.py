@@ -0,0 +1,139 @@
+from dataclasses import dataclass
+
+import numpy as np
+
+
+@dataclass(frozen=True)
+class PCAModel:
+    """
+    Fitted StandardScaler + PCA, stored once per dataset and
+    component count. Exposes the attributes the page reads from
+    sklearn's PCA (`components_`, `explained_variance_`,
+    `explained_variance_ratio_`). Rows are projected with a single
+    matrix multiply, see `project_rows` and `project_batches`.
+    """
+    features: list
+    n_samples_: int
+    mean_: np.ndarray
+    scale_: np.ndarray
+    components_: np.ndarray
+    explained_variance_: np.ndarray
+    explained_variance_ratio_: np.ndarray
+
+    @property
+    def n_components_(self):
+        return self.components_.shape[0]
+
+    @classmethod
+    def from_sklearn(cls, features, scaler, pca):
+        return cls(
+            features=list(features),
+            n_samples_=int(scaler.n_samples_seen_),
+            mean_=scaler.mean_,
+            scale_=scaler.scale_,
+            components_=pca.components_,
+            explained_variance_=pca.explained_variance_,
+            explained_variance_ratio_=pca.explained_variance_ratio_,
+        )
+
+    def transform(self, X):
+        return self.transform_scaled((X - self.mean_) / self.scale_)
+
+    def transform_scaled(self, X_scaled):
+        # Rows already standardized with mean_ and scale_
+        return X_scaled @ self.components_.T
+
+
+def feature_batches(lf, features, batch_size=50_000):
+    """
+    Feature matrices of the scan, one float64 batch at a time.
+    Only the feature columns are decoded and nulls become 0,
+    as in the in-memory fit.
+    """
+    batches = (
+        lf
+        .select(features)
+        .fill_null(0)
+        .collect_batches(chunk_size=batch_size)
+    )
+    for batch in batches:
+        yield batch.to_numpy().astype(np.float64)
+
+
+def project_batches(model, lf, batch_size=50_000):
+    """
+    Scores of the rows of the scan, projected batch by batch, so only
+    one float64 feature batch is held next to the (narrow) scores.
+    """
+    scores = [model.transform(X) for X in feature_batches(lf, model.features, batch_size)]
+    if not scores:
+        return np.empty((0, model.n_components_))
+
+    return np.vstack(scores)
+
+
+def accumulate_moments(batches):
+    """
+    Count, mean and co-moment matrix (sum of centered outer products)
+    merged batch by batch with Chan's pairwise update, so the sums stay
+    numerically stable without holding all rows.
+    """
+    n, mean, m2 = 0, None, None
+    for X in batches:
+        n_b = X.shape[0]
+        if n_b == 0:
+            continue
+
+        mean_b = X.mean(axis=0)
+        centered = X - mean_b
+        m2_b = centered.T @ centered
+
+        if n == 0:
+            n, mean, m2 = n_b, mean_b, m2_b
+            continue
+
+        n_ab = n + n_b
+        delta = mean_b - mean
+        m2 = m2 + m2_b + np.outer(delta, delta) * (n * n_b / n_ab)
+        mean = mean + delta * (n_b / n_ab)
+        n = n_ab
+
+    return n, mean, m2
+
+
+def fit_streaming_pca(lf, features, n_components=10, batch_size=50_000):
+    """
+    1. Stream the feature batches and accumulate count, mean, co-moments
+    2. Standardize the covariance with the StandardScaler statistics
+    3. Eigen-decompose it; components, variances and signs follow
+       sklearn's PCA so loadings match the in-memory fit
+    """
+    n, mean, m2 = accumulate_moments(feature_batches(lf, features, batch_size))
+
+    # StandardScaler: population std, constant columns are left unscaled
+    scale = np.sqrt(np.diag(m2) / n)
+    scale[scale == 0] = 1.0
+
+    covariance = m2 / (n - 1)
+    standardized = covariance / np.outer(scale, scale)
+
+    eigenvalues, eigenvectors = np.linalg.eigh(standardized)
+    order = np.argsort(eigenvalues)[::-1]
+    eigenvalues = np.clip(eigenvalues[order], 0, None)
+    components = eigenvectors[:, order].T
+
+    # Same sign convention as sklearn: largest loading of each PC is positive
+    max_abs = np.argmax(np.abs(components), axis=1)
+    signs = np.sign(components[np.arange(len(components)), max_abs])
+    components = components * signs[:, None]
+
+    return PCAModel(
+        features=list(features),
+        n_samples_=n,
+        mean_=mean,
+        scale_=scale,
+        components_=components[:n_components],
+        explained_variance_=eigenvalues[:n_components],
+        explained_variance_ratio_=eigenvalues[:n_components] / eigenvalues.sum(),
+    )
+
@@ -0,0 +1,150 @@
+from dataclasses import dataclass
+
+import numpy as np
+import polars as pl
+
+from app.l02_covariance import CELL_COLUMNS, cell_attributes
+from app.loaders import filter_expr, filter_state
+from app.plotting import MAX_BOX_OUTLIERS
+from app.variance import SUB_SAMPLE
+from app.weights import WEIGHT, value_counts, weight_of
+
+# Sketched column -> bin width. Both are integers (years), in unit
+# bins their histogram is the exact frequency table
+SKETCH_COLUMNS = {
+    "Age": 1,
+    "Years_of_Education": 1,
+}
+
+
+@dataclass(frozen=True)
+class DistributionSketches:
+    """
+    Fixed-bin histograms of the SKETCH_COLUMNS per cell and sub-sample,
+    with the row count and the weighted count of every bin.
+    Histograms merge by adding their bins, so the distribution of any
+    selection of cells costs O(cells x bins) instead of a pass over rows.
+
+    Error bound: a value is only known up to the start of its bin, so
+    merged quantiles, fences and means are within one bin width below
+    the ones of the rows, and bin counts are exact. With unit bins on
+    the integer columns the merged results equal the row-based ones.
+    """
+    partition: list
+    histograms: dict
+
+    def can_merge(self, filter_map:dict):
+        return all(col in self.partition for col, _ in filter_state(filter_map))
+
+    def histogram(self, col, filter_map:dict):
+        """
+        Merged [col, Sub_sample, count, weight] bins of the cells selected
+        by `filter_map`, which must only use partition columns.
+        """
+        return (
+            self.histograms[col].lazy()
+            .filter(filter_expr(filter_map))
+            .group_by(col, SUB_SAMPLE)
+            .agg(pl.col("count").sum(), pl.col("weight").sum())
+            .sort(col, SUB_SAMPLE, nulls_last=True)
+            .collect()
+        )
+
+
+def build_distribution_sketches(df, filter_columns, columns=SKETCH_COLUMNS, cell_columns=CELL_COLUMNS):
+    """
+    The histograms of every column per cell, evaluated in one `collect_all`.
+    """
+    partition = [*cell_columns, *cell_attributes(df, filter_columns, cell_columns), SUB_SAMPLE]
+
+    frames = [
+        df.lazy()
+        .group_by(*partition, ((pl.col(col) // width) * width).alias(col))
+        .agg(pl.len().alias("count"), weight_of(WEIGHT).sum().alias("weight"))
+        for col, width in columns.items()
+    ]
+
+    return DistributionSketches(
+        partition=partition,
+        histograms=dict(zip(columns, pl.collect_all(frames))),
+    )
+
+
+def frequency(weight=None):
+    # Bin column to count with: rows, or estimated population
+    return "count" if weight is None else "weight"
+
+
+def histogram_counts(hist, col, weight=None):
+    """
+    `value_counts` of the rows behind a merged histogram, its bins
+    are the counts per (col, Sub_sample).
+    """
+    return value_counts(hist, col, weight)
+
+
+def histogram_bins(hist, col, weight=None):
+    """
+    Non-null bins summed over the sub-samples, as numpy arrays of the
+    bin values and their frequency.
+    """
+    bins = (
+        hist
+        .drop_nulls(col)
+        .group_by(col)
+        .agg(pl.col(frequency(weight)).sum())
+        .sort(col)
+    )
+    return bins[col].to_numpy(), bins[frequency(weight)].to_numpy().astype(np.float64)
+
+
+def histogram_quantiles(hist, col, quantiles, weight=None):
+    """
+    Quantiles of the merged histogram, with the same rules as the row
+    based ones: linear interpolation between ranks for counts, smallest
+    value whose cumulative weight reaches the quantile when weighted.
+    """
+    values, freq = histogram_bins(hist, col, weight)
+    cum = np.cumsum(freq)
+    if len(values) == 0:
+        return [None] * len(quantiles)
+
+    if weight is not None:
+        positions = np.searchsorted(cum, np.asarray(quantiles) * cum[-1], side="left")
+        return values[np.minimum(positions, len(values) - 1)].astype(np.float64).tolist()
+
+    def at_rank(rank):
+        return values[np.searchsorted(cum, rank, side="right")].astype(np.float64)
+
+    result = []
+    for q in quantiles:
+        h = (cum[-1] - 1) * q
+        low, high = at_rank(np.floor(h)), at_rank(np.ceil(h))
+        result.append(float(low + (h - np.floor(h)) * (high - low)))
+    return result
+
+
+def histogram_box_stats(hist, col, weight=None, max_outliers=MAX_BOX_OUTLIERS):
+    """
+    One box of `box_stats` layout from a merged histogram. The outliers
+    are the distinct outlying bin values, a bin is drawn once.
+    """
+    values, freq = histogram_bins(hist, col, weight)
+    if len(values) == 0:
+        return pl.DataFrame()
+
+    q1, median, q3 = histogram_quantiles(hist, col, [0.25, 0.5, 0.75], weight)
+    low, high = q1 - 1.5 * (q3 - q1), q3 + 1.5 * (q3 - q1)
+    outliers = values[(values < low) | (values > high)][:max_outliers]
+
+    return pl.DataFrame({
+        "box": [col],
+        "q1": [q1],
+        "median": [median],
+        "q3": [q3],
+        "mean": [float((values * freq).sum() / freq.sum())],
+        "count": [int(hist.drop_nulls(col)["count"].sum())],
+        "lowerfence": [values[values >= low].min()],
+        "upperfence": [values[values <= high].max()],
+        "outliers": [outliers.tolist()],
+    })
@@ -1,3 +1,8 @@
+from dataclasses import dataclass
+
+import numpy as np
+import polars as pl
+
 def category_mapping():
     return {
         129: "cereals",
@@ -191,3 +196,95 @@ def beverages_mapping():
         # 279: "beverages: sub-total"
     }
 
+
+# Item families of the Level 05 page, pill label -> mapping
+CATEGORY_FN_MAP = {
+    "All Category": category_mapping,
+    "Cereal Family": cereal_mapping,
+    "Pulses Family": pulses_mapping,
+    "Salt & Sugar Family": salt_sugar_mapping,
+    "Milk Family": milk_mapping,
+    "Vegetables": vegetables_mapping,
+    "Fresh Fruits": fruits_fresh_mapping,
+    "Dry Fruits": fruits_dry_mapping,
+    "Non-Veg": nonveg_mapping,
+    "Edible Oil": edible_oil_mapping,
+    "Spices Mapping": spices_mapping,
+    "Beverages": beverages_mapping,
+}
+
+# Sub-total code of "All Category" -> mapping of the items under it.
+# 139, 289 and 299 have no item breakdown.
+SUBTOTAL_FAMILIES = {
+    129: cereal_mapping,
+    159: pulses_mapping,
+    179: salt_sugar_mapping,
+    169: milk_mapping,
+    219: vegetables_mapping,
+    239: fruits_fresh_mapping,
+    249: fruits_dry_mapping,
+    199: nonveg_mapping,
+    189: edible_oil_mapping,
+    269: spices_mapping,
+    279: beverages_mapping,
+}
+
+def category_lookup():
+    """
+    One (family, Item_Code, category_mapped) row per item of every family.
+    An Item_Code can sit in several families, 129 is the "cereals"
+    sub-total of "All Category" and a line of "Cereal Family".
+    """
+    rows = [
+        (family, code, label)
+        for family, mapping_fn in CATEGORY_FN_MAP.items()
+        for code, label in mapping_fn().items()
+    ]
+    family, item_code, label = zip(*rows)
+
+    return pl.DataFrame({
+        "family": family,
+        "Item_Code": item_code,
+        "category_mapped": label,
+    })
+
+@dataclass(frozen=True)
+class ItemLookup:
+    """
+    Dense form of the category lookup. `items` holds the lookup rows,
+    the item id of a row is its position. `slots[s, code]` is the id of
+    the s-th family line of an Item_Code, -1 when there is none.
+    There are as many slots as families an Item_Code appears in at most.
+    """
+    items: pl.DataFrame
+    slots: np.ndarray
+
+    def item_ids(self, item_codes):
+        """
+        Item id of every code for each slot, gathered from the dense table.
+        Codes outside the table (or null) get -1.
+        """
+        codes = item_codes.fill_null(-1).cast(pl.Int64).to_numpy()
+        known = (codes >= 0) & (codes < self.slots.shape[1])
+
+        ids = []
+        for slot in self.slots:
+            slot_ids = np.full(len(codes), -1, dtype=np.int32)
+            slot_ids[known] = slot[codes[known]]
+            ids.append(slot_ids)
+
+        return ids
+
+def compile_item_lookup(lookup):
+    """
+    Dense Item_Code -> item id table of a `category_lookup` frame.
+    """
+    codes = lookup["Item_Code"].to_numpy()
+    # n-th occurrence of every code gives its slot
+    occurrence = lookup.select(pl.int_range(pl.len()).over("Item_Code"))
+    occurrence = occurrence.to_series().to_numpy()
+
+    slots = np.full((occurrence.max() + 1, codes.max() + 1), -1, dtype=np.int32)
+    slots[occurrence, codes] = np.arange(lookup.height, dtype=np.int32)
+
+    return ItemLookup(items=lookup, slots=slots)
@@ -0,0 +1,112 @@
+import os
+import tempfile
+
+import polars as pl
+from pathlib import Path
+
+from app.loaders import file_fingerprint, resolve_source, scan_level_05
+from app.weights import weighted_total
+
+# Grain of the cube, every category view is a roll-up of these
+CUBE_DIMENSIONS = [
+    "District",
+    "Sector",
+    "NSS_Region",
+    "Stratum",
+    "Sub_sample",
+    "Item_Code",
+]
+
+# Dimensions the Level 05 page lets the user filter on
+CUBE_FILTER_COLUMNS = CUBE_DIMENSIONS[:-1]
+
+CUBE_MEASURES = [
+    "OutOfHome_Consumption_Quantity",
+    "OutOfHome_Consumption_Value",
+    "Total_Consumption_Quantity",
+    "Total_Consumption_Value",
+]
+
+# Survey weighted sum of every measure, see `select_measures`
+WEIGHTED_SUFFIX = "_weighted"
+
+CUBE_COLUMNS = (
+    CUBE_DIMENSIONS
+    + CUBE_MEASURES
+    + [f"{col}{WEIGHTED_SUFFIX}" for col in CUBE_MEASURES]
+)
+
+FINGERPRINT_KEY = "source_fingerprint"
+COLUMNS_KEY = "cube_columns"
+
+def cube_path(source_path):
+    # data/BL05.parquet -> data/BL05.cube.parquet
+    source_path = Path(source_path)
+    return source_path.with_name(f"{source_path.stem}.cube.parquet")
+
+def build_consumption_cube(lf):
+    """
+    Pre-sum the consumption measures of the item table by the cube
+    dimensions. The sums keep the source column names, so the category
+    views work on the cube exactly as they did on the item rows.
+    Every measure also gets its Multiplier weighted sum.
+    """
+    return (
+        lf
+        .group_by(CUBE_DIMENSIONS)
+        .agg(
+            [pl.col(col).sum() for col in CUBE_MEASURES]
+            + [weighted_total(col).alias(f"{col}{WEIGHTED_SUFFIX}") for col in CUBE_MEASURES]
+        )
+        .sort(CUBE_DIMENSIONS)
+        .collect()
+    )
+
+def load_consumption_cube(source_path):
+    """
+    1. Read the persisted cube if it was built from the current source
+       file with the current cube columns
+    2. Otherwise rebuild it from the item table and persist it
+       together with the fingerprint of the source file. The file is
+       written under a unique temporary name and renamed, so a worker
+       rebuilding at the same time never reads a half written cube
+    """
+    path = cube_path(source_path)
+    fingerprint = file_fingerprint(resolve_source(source_path))
+    columns = ",".join(CUBE_COLUMNS)
+
+    if path.exists():
+        metadata = pl.read_parquet_metadata(path)
+        if metadata.get(FINGERPRINT_KEY) == fingerprint and metadata.get(COLUMNS_KEY) == columns:
+            return pl.read_parquet(path)
+
+    cube = build_consumption_cube(scan_level_05(source_path))
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f"{path.name}.", suffix=".tmp")
+    os.close(fd)
+    try:
+        cube.write_parquet(tmp_path, metadata={FINGERPRINT_KEY: fingerprint, COLUMNS_KEY: columns})
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+    return cube
+
+def select_measures(cube, weighted=False):
+    """
+    The cube with its measures replaced by their weighted sums when
+    `weighted`, so every category view and chart works on either.
+    """
+    if not weighted:
+        return cube
+
+    return cube.with_columns([
+        pl.col(f"{col}{WEIGHTED_SUFFIX}").alias(col) for col in CUBE_MEASURES
+    ])
+
+if __name__ == "__main__":
+    # Offline build: python -m app.l05_cube
+    from app.loaders import LEVEL_05_PATH
+
+    cube = load_consumption_cube(LEVEL_05_PATH)
+    print(f"{cube_path(LEVEL_05_PATH)}: {cube.height} rows")
@@ -1,75 +1,92 @@
 import streamlit as st
 import polars as pl
-import builtins
 import plotly.express as px
-import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 
 import pandas as pd
-import time
 from sklearn.preprocessing import StandardScaler
 from sklearn.decomposition import PCA
 from sklearn.cluster import KMeans
 
-@st.cache_data
-def load_level_05_data(path):
-    # Load the data
-    df = pl.read_parquet(path)
-    
-    # Correct datatype
-    df = df.with_columns(
-            (pl.col("OutOfHome_Consumption_Quantity").cast(pl.Float64, strict=False)),
-            (pl.col("OutOfHome_Consumption_Value").cast(pl.Float64, strict=False))
-        )
-    
-    # Select useful columns only
-    df = df.select([
-        'FSU_Serial_No','Sector','NSS_Region','District','Stratum',
-        'Sub_stratum','Panel','Sub_sample','FOD_Sub_Region',
-        'Sample_SU_No','Sample_Household_No','Questionnaire_No',
-        'Item_Code','OutOfHome_Consumption_Quantity','OutOfHome_Consumption_Value',
-        'Total_Consumption_Quantity','Total_Consumption_Value'
-    ])
-    
-    return df
+from app.cache import TTLCache
+from app.l05_categories import category_lookup, compile_item_lookup
+from app.l05_taxonomy import build_item_taxonomy
+from app.loaders import LEVEL_05_COLUMNS, filter_state, scan_level_05
+from app.memory import column_memory_report
+from app.plotting import box_stats, box_traces
+from app.profiling import StageReporter
+from app.schema import downcast
+from app.store import load_table, scan_columns
+from app.variance import subsample_estimates
+
+@st.cache_resource
+def load_level_05_table(path):
+    # Loaded once per process and shared read-only by every session,
+    # memory-mapped from the IPC store when it is up to date
+    return load_table(
+        "BL05",
+        path,
+        lambda: downcast(scan_level_05(path).collect()).rechunk(),
+        columns=scan_columns(scan_level_05, path),
+    )
+
+@st.cache_resource
+def level_05_column_report(path):
+    # Raw parquet dtypes against the shared table, computed once
+    raw = pl.read_parquet(path, columns=LEVEL_05_COLUMNS)
+    return column_memory_report(raw, load_level_05_table(path))
+
+# Columns of a category view, each with a `<metric>_se` twin
+CATEGORY_METRICS = [
+    "out_home_value", "out_home_qty", "total_qty",
+    "total_value", "out_of_home_avg_pice", "total_avg_pice",
+]
 
-@st.cache_data
-def category_dict_to_dataframe(category_mapping:dict, fdf):
+@st.cache_resource
+def load_item_lookup():
+    # Compiled once per process from the mappings of all the families
+    return compile_item_lookup(category_lookup())
+
+def category_families_dataframe(item_lookup, fdf):
     """
-    1. Create the dataframe form the dict
-    2. Join with the original / Filter dataset
-    3. Create totally new dataset for further analysis
-        a. Only valid data 
-        b. Then category, Out of Home and Total columns selected
-        c. Aggregate the columns
-        d. Provide a clean and valid dataset for further analysis.
+    1. Gather the item id of every row from the dense Item_Code table,
+       once per family an Item_Code can belong to (no join)
+    2. Aggregate by item id in a single group_by
+        a. Only items of some family are kept
+        b. Out of Home and Total columns are summed
+        c. Average prices are derived from the sums
+        d. Every sum and price gets its sub-sample standard error
+    3. Attach family / category and split into one frame per family
     """
-     
-    # Create the dataframe form dictionary
-    map_df = pl.DataFrame({
-        "Item_Code": builtins.list(category_mapping.keys()),
-        "category_mapped": builtins.list(category_mapping.values()),
-    })
 
-    # Join the category dataframe & whole dataset
-    fdf = fdf.join(map_df, on="Item_Code", how="left")
-    
-    # Create a totally new dataframe with desire columns
-    cat_df = fdf.filter(
-        pl.col("category_mapped").is_not_null()
-        ) \
-        [
+    # Only the consumption columns are read
+    measures = fdf.select(
+        'Sub_sample',
         'OutOfHome_Consumption_Quantity',
         'OutOfHome_Consumption_Value',
         'Total_Consumption_Quantity',
         'Total_Consumption_Value',
-        "category_mapped"
-        ] \
-        .group_by("category_mapped").agg(
-            pl.col("OutOfHome_Consumption_Value").sum().alias("out_home_value"),
-            pl.col("OutOfHome_Consumption_Quantity").sum().alias("out_home_qty"),
-            pl.col("Total_Consumption_Quantity").sum().alias("total_qty"),
-            pl.col("Total_Consumption_Value").sum().alias("total_value")
+    )
+    item_rows = pl.concat([
+        measures.lazy()
+        .with_columns(item_id=pl.Series(ids))
+        .filter(pl.col("item_id") >= 0)
+        for ids in item_lookup.item_ids(fdf["Item_Code"])
+    ])
+
+    cat_df = subsample_estimates(
+            item_rows,
+            ["item_id"],
+            totals={
+                "out_home_value": pl.col("OutOfHome_Consumption_Value").sum(),
+                "out_home_qty": pl.col("OutOfHome_Consumption_Quantity").sum(),
+                "total_qty": pl.col("Total_Consumption_Quantity").sum(),
+                "total_value": pl.col("Total_Consumption_Value").sum(),
+            },
+            ratios={
+                "out_of_home_avg_pice": ("out_home_value", "out_home_qty"),
+                "total_avg_pice": ("total_value", "total_qty"),
+            },
         ).with_columns(
             out_of_home_avg_pice = pl.when(pl.col("out_home_qty") > 0) 
                             .then(pl.col("out_home_value") / pl.col("out_home_qty"))
@@ -77,15 +94,79 @@ def category_dict_to_dataframe(category_mapping:dict, fdf):
             total_avg_pice = pl.when(pl.col("total_qty") > 0) 
                             .then(pl.col("total_value") / pl.col("total_qty"))
                             .otherwise(0),
-        ) 
-        
-    return cat_df
+        ).select(
+            "item_id", *CATEGORY_METRICS, *[f"{col}_se" for col in CATEGORY_METRICS]
+        )
+
+    # Family and category of every aggregated item, by position
+    items = item_lookup.items[cat_df["item_id"]].select("family", "category_mapped")
+    cat_df = pl.concat([items, cat_df.drop("item_id")], how="horizontal")
+
+    families = {
+        family: part
+        for (family,), part in cat_df.partition_by("family", as_dict=True, include_key=False).items()
+    }
+    # Families without any item under the filter get an empty frame
+    empty = cat_df.drop("family").clear()
+
+    return {family: families.get(family, empty) for family in item_lookup.items["family"].unique(maintain_order=True)}
+
+@st.cache_resource
+def category_view_cache():
+    # One bounded cache per process, shared by every session
+    return TTLCache(maxsize=256, ttl=3600)
+
+def category_view(mapping_name, fdf, fingerprint, filter_map:dict, weighted=False):
+    """
+    Category view of `fdf`. The views of all the families are built
+    together and cached on (dataset fingerprint, normalized filter
+    state, weighting), switching family only picks another frame
+    from the cache.
+    """
+    key = (fingerprint, filter_state(filter_map), weighted)
+    families = category_view_cache().get_or_compute(
+        key,
+        lambda: category_families_dataframe(load_item_lookup(), fdf)
+    )
+    return families[mapping_name]
+
+@st.cache_resource
+def load_item_taxonomy():
+    return build_item_taxonomy()
+
+def category_rollup(fdf, fingerprint, filter_map:dict, weighted=False):
+    """
+    Taxonomy roll-up of `fdf`, cached next to the category views on
+    (dataset fingerprint, normalized filter state, weighting).
+    """
+    key = (fingerprint, filter_state(filter_map), weighted, "rollup")
+    return category_view_cache().get_or_compute(
+        key,
+        lambda: load_item_taxonomy().rollup(fdf)
+    )
+
+def consumption_drill_down(rollup, metric="total_value", kind="sunburst"):
+    # Every level is precomputed, plotly only draws the hierarchy
+    chart = px.sunburst if kind == "sunburst" else px.treemap
+    fig = chart(
+        rollup.to_pandas(),
+        ids="id",
+        names="label",
+        parents="parent",
+        values=metric,
+        branchvalues="total",
+        maxdepth=2,
+        title=f"{metric} by Item Family",
+    )
+    fig.update_layout(height=700)
+    return fig
 
 def total_consumption_qty_by_category(cat_df):
     return px.bar(
         cat_df.sort('total_qty'),
         x="total_qty",
         y="category_mapped",
+        error_x="total_qty_se",
         orientation="h",
         title="Total Consumption Quantity by Category"
     )
@@ -95,6 +176,7 @@ def total_consumption_value_by_category(cat_df):
         cat_df.sort('total_value'),
         x="total_value",
         y="category_mapped",
+        error_x="total_value_se",
         orientation="h",
         title="Total Consumption Value by Category"
     )  
@@ -104,6 +186,7 @@ def out_of_home_consumption_qty_by_category(cat_df):
         cat_df.sort('out_home_qty'),
         x="out_home_qty",
         y="category_mapped",
+        error_x="out_home_qty_se",
         orientation="h",
         title="Out of Home Consumption Quantity by Category"
     )
@@ -113,6 +196,7 @@ def out_of_home_consumption_value_by_category(cat_df):
         cat_df.sort('out_home_value'),
         x="out_home_value",
         y="category_mapped",
+        error_x="out_home_value_se",
         orientation="h",
         title="Out of Home Consumption Value by Category"
     )  
@@ -136,18 +220,10 @@ def distribution_of_metric_by_categories(
         (2, 1), (2, 2), (2, 3)
     ]
 
+    # Precomputed quartiles / whiskers / mean per metric, not raw values
     for col, (r, c) in zip(cols, positions):
-        fig.add_trace(
-            go.Box(
-                y=df[col],
-                name=col,
-                boxmean=True,
-                hovertext=df["category_mapped"],
-
-            ),
-            row=r,
-            col=c
-        )
+        for trace in box_traces(box_stats(df, col)):
+            fig.add_trace(trace, row=r, col=c)
 
     fig.update_layout(
         title=title,
@@ -214,7 +290,7 @@ def out_of_home_qty_vs_out_of_home_avg_price_by_category(df):
     )
 
 def group_bar_chart_qty_type(df):
-    return df.select([
+    qty_df = df.select([
         "category_mapped",
         "out_home_qty",
         "total_qty"
@@ -224,19 +300,22 @@ def group_bar_chart_qty_type(df):
         variable_name="quantity_type",
         value_name="quantity"
     )
+    qty_se = df.select(["out_home_qty_se", "total_qty_se"]).unpivot(value_name="quantity_se")
+    return qty_df.with_columns(qty_se["quantity_se"])
 
 def out_of_home_vs_total_qty_by_category(qty_df):
     return px.bar(
         qty_df,
         x="category_mapped",
         y="quantity",
+        error_y="quantity_se",
         color="quantity_type",
         barmode="group",
         title="Out-of-Home vs Total Quantity by Category"
     )
 
 def stack_bar_chart_on_value(df):
-    return df.select([
+    val_df = df.select([
         "category_mapped",
         "out_home_value",
         "total_value"
@@ -246,12 +325,15 @@ def stack_bar_chart_on_value(df):
         variable_name="value_type",
         value_name="value"
     )
+    val_se = df.select(["out_home_value_se", "total_value_se"]).unpivot(value_name="value_se")
+    return val_df.with_columns(val_se["value_se"])
 
 def out_of_home_vs_total_value_stack_graph(val_df):
     return px.bar(
         val_df,
         x="category_mapped",
         y="value",
+        error_y="value_se",
         color="value_type",
         barmode="stack",
         title="Out-of-Home vs Total Consumption Value"
@@ -289,30 +371,37 @@ def pca_kmeans_category_clustering(
     "total_value", "out_of_home_avg_pice","total_avg_pice",],
     n_components=2,
     n_clusters=4,
-    random_state=42
+    random_state=42,
+    _reporter=None
 ):
+    # Stages are only reported when the fit is not served from cache
+    reporter = _reporter or StageReporter("pca_kmeans_category_clustering")
    
-    if hasattr(cat_df, "to_pandas"):
-        pdf = cat_df.to_pandas()
-    else:
-        pdf = cat_df.copy()
+    with reporter.stage("Convert Polars to Pandas"):
+        if hasattr(cat_df, "to_pandas"):
+            pdf = cat_df.to_pandas()
+        else:
+            pdf = cat_df.copy()
     
     labels = pdf["category_mapped"]
     
-    X = pdf[feature_cols].fillna(0)
-    
-    scaler = StandardScaler()
-    X_scaled = scaler.fit_transform(X)
+    with reporter.stage("Feature selection & Standard Scaler"):
+        X = pdf[feature_cols].fillna(0)
+        
+        scaler = StandardScaler()
+        X_scaled = scaler.fit_transform(X)
     
-    pca = PCA(n_components=n_components, random_state=random_state)
-    X_pca = pca.fit_transform(X_scaled)
+    with reporter.stage("PCA fit"):
+        pca = PCA(n_components=n_components, random_state=random_state)
+        X_pca = pca.fit_transform(X_scaled)
     
-    kmeans = KMeans(
-        n_clusters=n_clusters,
-        n_init=10,
-        random_state=random_state
-    )
-    clusters = kmeans.fit_predict(X_pca)
+    with reporter.stage("KMeans fit"):
+        kmeans = KMeans(
+            n_clusters=n_clusters,
+            n_init=10,
+            random_state=random_state
+        )
+        clusters = kmeans.fit_predict(X_pca)
     
     result_df = pd.DataFrame({
         "category_mapped": labels,
@@ -334,27 +423,3 @@ def pca_2d_graph(pca_df):
         title="Category Clustering after PCA",
         color_continuous_scale='Bluered_r'
     )
-
-def loading_status_for_pca():
-    with st.status("Train the model", expanded=True) as status:
-        st.info("""n_components=2, n_clusters=2 \n
-                No of components for 2 axis PC1 & PC2 
-                No of cluster means all the items \n
-                We Can be divided into two parts 
-                Like 1.Easy to access 2.Not easy to access
-                or 1. More used 2. Less used etc.
-                """, icon="ℹ️")
-        
-        st.write("Searching for data...")
-        time.sleep(5)
-        st.write("converted Polar to Pandas dataframe")
-        time.sleep(3)
-        st.write("Apply Standard Scaler Processing...")
-        time.sleep(3)
-        st.write("KMeans & PCA performing ...")
-        time.sleep(5)
-        st.write("Showing Graphs...")
-        time.sleep(3)
-        status.update(
-            label=" 🎉Showing Graphs complete!", state="complete", expanded=False
-        )
\ No newline at end of file
@@ -0,0 +1,109 @@
+from dataclasses import dataclass
+
+import polars as pl
+
+from app.l05_categories import SUBTOTAL_FAMILIES, category_mapping
+
+ROOT_ID = "All"
+
+TAXONOMY_MEASURES = {
+    "OutOfHome_Consumption_Value": "out_home_value",
+    "OutOfHome_Consumption_Quantity": "out_home_qty",
+    "Total_Consumption_Quantity": "total_qty",
+    "Total_Consumption_Value": "total_value",
+}
+
+@dataclass(frozen=True)
+class ItemTaxonomy:
+    """
+    Item hierarchy of Level 05: all items -> sub-total families -> items.
+    `nodes` has one row per node (id, parent, label, depth, Item_Code).
+    Leaves carry the Item_Code whose rows they sum. A family with an
+    item breakdown is the sum of its items, its own sub-total rows are
+    not counted, so no consumption is counted twice.
+    """
+    nodes: pl.DataFrame
+
+    @property
+    def max_depth(self):
+        return self.nodes["depth"].max()
+
+    def leaves(self):
+        return self.nodes.filter(pl.col("Item_Code").is_not_null())
+
+    def rollup(self, fdf):
+        """
+        Consumption sums of every node. The rows are read once, grouped
+        by Item_Code, every level above is summed from the one below.
+        """
+        item_totals = (
+            fdf.lazy()
+            .group_by("Item_Code")
+            .agg([pl.col(col).sum().alias(name) for col, name in TAXONOMY_MEASURES.items()])
+            .with_columns(pl.col("Item_Code").cast(pl.Int64))
+            .collect()
+        )
+
+        measures = list(TAXONOMY_MEASURES.values())
+        totals = (
+            self.leaves()
+            .join(item_totals, on="Item_Code", how="left")
+            .with_columns(pl.col(measures).fill_null(0))
+            .select("id", "depth", *measures)
+        )
+
+        parents = self.nodes.select("id", "parent", "depth")
+        for depth in range(self.max_depth, 0, -1):
+            level = (
+                totals
+                .filter(pl.col("depth") == depth)
+                .join(parents.select("id", "parent"), on="id")
+                .group_by("parent")
+                .agg(pl.col(measures).sum())
+                .rename({"parent": "id"})
+                .join(parents.select("id", "depth"), on="id")
+                .select("id", "depth", *measures)
+            )
+            totals = pl.concat([totals, level])
+
+        return (
+            self.nodes
+            .drop("depth")
+            .join(totals, on="id", how="left")
+            .with_columns(
+                out_of_home_avg_pice = pl.when(pl.col("out_home_qty") > 0)
+                                .then(pl.col("out_home_value") / pl.col("out_home_qty"))
+                                .otherwise(0),
+                total_avg_pice = pl.when(pl.col("total_qty") > 0)
+                                .then(pl.col("total_value") / pl.col("total_qty"))
+                                .otherwise(0),
+            )
+        )
+
+def build_item_taxonomy():
+    rows = [(ROOT_ID, None, "All items", 0, None)]
+
+    for subtotal, family_label in category_mapping().items():
+        family_id = f"{ROOT_ID}/{subtotal}"
+        mapping_fn = SUBTOTAL_FAMILIES.get(subtotal)
+        items = {
+            code: label
+            for code, label in (mapping_fn() if mapping_fn else {}).items()
+            if code != subtotal
+        }
+
+        # Families without a breakdown are leaves of their own sub-total rows
+        rows.append((family_id, ROOT_ID, family_label, 1, None if items else subtotal))
+        rows.extend(
+            (f"{family_id}/{code}", family_id, label, 2, code)
+            for code, label in items.items()
+        )
+
+    node_id, parent, label, depth, item_code = zip(*rows)
+    return ItemTaxonomy(pl.DataFrame({
+        "id": node_id,
+        "parent": parent,
+        "label": label,
+        "depth": depth,
+        "Item_Code": item_code,
+    }, schema_overrides={"parent": pl.String, "Item_Code": pl.Int64}))
@@ -0,0 +1,133 @@
+import polars as pl
+from pathlib import Path
+
+from app.keys import HOUSEHOLD_KEY_FIELDS, PERSON_KEY_FIELDS, check_key_fields, household_id, person_id
+
+DATA_DIR = Path("data")
+LEVEL_02_PATH = DATA_DIR / "BL02.parquet"
+LEVEL_05_PATH = DATA_DIR / "BL05.parquet"
+
+# Columns the Level 02 page lets the user filter on
+LEVEL_02_FILTER_COLUMNS = [
+    "FSU_Serial_No",
+    "Sector",
+    "NSS_Region",
+    "District",
+    "Stratum",
+    "Sub_stratum",
+    "Panel",
+    "Sub_sample",
+    "FOD_Sub_Region",
+    "Sample_SU_No",
+    # "Sample_Sub_Division_No",
+    # "Second_Stage_Stratum_No",
+    "Sample_Household_No",
+]
+
+# Useful columns of the Level 05 item table
+LEVEL_05_COLUMNS = [
+    'FSU_Serial_No','Sector','NSS_Region','District','Stratum',
+    'Sub_stratum','Panel','Sub_sample','FOD_Sub_Region',
+    'Sample_SU_No','Sample_Household_No','Questionnaire_No',
+    'Item_Code','OutOfHome_Consumption_Quantity','OutOfHome_Consumption_Value',
+    'Total_Consumption_Quantity','Total_Consumption_Value',
+    'Multiplier'
+]
+
+def file_fingerprint(path):
+    """
+    Cheap identity of a data file: size and modification time.
+    Any rewrite of the file changes it.
+    """
+    stat = Path(path).stat()
+    return f"{stat.st_size}-{stat.st_mtime_ns}"
+
+SOURCE_FINGERPRINT_KEY = "source_fingerprint"
+
+def build_path(source_path):
+    # data/BL02.parquet -> data/BL02.build.parquet
+    source_path = Path(source_path)
+    return source_path.with_name(f"{source_path.stem}.build.parquet")
+
+def resolve_source(path):
+    """
+    The built copy of `path` (python -m app.build) when it was built
+    from the current file, otherwise `path` itself.
+    """
+    built = build_path(path)
+    if built.exists():
+        metadata = pl.read_parquet_metadata(built)
+        if metadata.get(SOURCE_FINGERPRINT_KEY) == file_fingerprint(path):
+            return built
+
+    return path
+
+# (source, fingerprint) of the files whose key fields were checked,
+# so a file is only checked once per version
+_checked_sources = set()
+
+def scan_source(path, key_fields):
+    """
+    Lazy scan of the resolved source of `path`. Before the first scan of
+    a file version, fails (ValueError) when a key field does not fit its
+    bits, instead of letting packed ids of different keys collide.
+    """
+    source = resolve_source(path)
+    lf = pl.scan_parquet(source)
+
+    tag = (str(source), file_fingerprint(source))
+    if tag not in _checked_sources:
+        check_key_fields(lf, key_fields)
+        _checked_sources.add(tag)
+
+    return lf
+
+def scan_level_02(path=LEVEL_02_PATH):
+    """
+    Lazy scan of the Level 02 person table, with the packed
+    household_id / person_id keys derived in the plan.
+    Nothing is decoded until the caller collects, so filters and
+    column selections on top of it are pushed into the parquet reader.
+    """
+    return scan_source(path, PERSON_KEY_FIELDS).with_columns(household_id(), person_id())
+
+def scan_level_05(path=LEVEL_05_PATH):
+    """
+    Lazy scan of the Level 05 item table with the datatype fixups,
+    the packed household_id and the useful column selection already
+    in the plan.
+    The casts are no-ops on the built file, which stores final dtypes.
+    """
+    return (
+        scan_source(path, HOUSEHOLD_KEY_FIELDS)
+        .with_columns(
+            (pl.col("OutOfHome_Consumption_Quantity").cast(pl.Float64, strict=False)),
+            (pl.col("OutOfHome_Consumption_Value").cast(pl.Float64, strict=False)),
+            household_id(),
+        )
+        .select(*LEVEL_05_COLUMNS, "household_id")
+    )
+
+def filter_expr(filter_map:dict):
+    """
+    Combine the selectbox values into one predicate.
+    "All" means the column is not filtered.
+    """
+    predicates = [
+        pl.col(col) == val
+        for col, val in filter_map.items()
+        if val != "All"
+    ]
+    if not predicates:
+        return pl.lit(True)
+
+    return pl.all_horizontal(predicates)
+
+def filter_state(filter_map:dict):
+    """
+    Hashable, order independent form of the selections,
+    used as part of cache keys. "All" selections are dropped.
+    """
+    return tuple(sorted(
+        (col, val) for col, val in filter_map.items() if val != "All"
+    ))
@@ -0,0 +1,94 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import polars as pl
+
+def process_rss_bytes():
+    """
+    Resident memory of this process. Current RSS on Linux,
+    peak RSS elsewhere (where only that is available), None on Windows.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in KB on Linux/BSD
+    return peak if sys.platform == "darwin" else peak * 1024
+
+def object_nbytes(obj):
+    """
+    Approximate size of a shared object held by the process.
+    """
+    if isinstance(obj, pl.DataFrame):
+        return obj.estimated_size()
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes
+    if isinstance(obj, dict):
+        return sum(object_nbytes(value) for value in obj.values())
+    if isinstance(obj, (list, tuple)):
+        return sum(object_nbytes(value) for value in obj)
+    if hasattr(obj, "__dataclass_fields__"):
+        return sum(object_nbytes(getattr(obj, name)) for name in obj.__dataclass_fields__)
+    return 0
+
+def memory_report(shared:dict):
+    """
+    One row per shared object (name -> object) plus the process RSS.
+    """
+    rows = [
+        {
+            "object": name,
+            "rows": obj.height if isinstance(obj, pl.DataFrame) else None,
+            "MB": object_nbytes(obj) / 1024**2,
+        }
+        for name, obj in shared.items()
+    ]
+
+    rss = process_rss_bytes()
+    rows.append({
+        "object": "Process resident memory",
+        "rows": None,
+        "MB": rss / 1024**2 if rss is not None else None,
+    })
+
+    return pd.DataFrame(rows)
+
+def column_memory_report(before, after):
+    """
+    Per-column dtype and size of a table before and after the load time
+    downcasting, with a total row.
+    """
+    rows = [
+        {
+            "column": col,
+            "dtype before": str(before[col].dtype),
+            "dtype after": str(after[col].dtype),
+            "MB before": before[col].estimated_size() / 1024**2,
+            "MB after": after[col].estimated_size() / 1024**2,
+        }
+        for col in after.columns
+        if col in before.columns
+    ]
+
+    report = pd.DataFrame(rows)
+    total = {
+        "column": "Total",
+        "dtype before": None,
+        "dtype after": None,
+        "MB before": report["MB before"].sum(),
+        "MB after": report["MB after"].sum(),
+    }
+    report = pd.concat([report, pd.DataFrame([total])], ignore_index=True)
+    report["reduction"] = report["MB before"] / report["MB after"]
+
+    return report
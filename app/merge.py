@@ -0,0 +1,121 @@
+import numpy as np
+import polars as pl
+import plotly.express as px
+import streamlit as st
+
+from app.loaders import LEVEL_02_PATH, LEVEL_05_PATH, scan_level_02, scan_level_05
+from app.l05_taxonomy import build_item_taxonomy
+from app.variance import subsample_estimates
+from app.weights import weighted_total
+
+# Survey design columns carried to the household table, so it can be
+# filtered like the Level 05 cube
+HOUSEHOLD_DESIGN_COLUMNS = ["District", "Sector", "NSS_Region", "Stratum", "Sub_sample"]
+
+def household_members(lf):
+    """
+    Level 02 persons aggregated to one row per household_id.
+    The education of the household is the one of its head.
+    """
+    head = pl.col("Relation_to_Head") == 1
+    return (
+        lf
+        .group_by("household_id")
+        .agg(
+            *[pl.col(col).first() for col in HOUSEHOLD_DESIGN_COLUMNS],
+            pl.col("Multiplier").first(),
+            pl.len().alias("household_size"),
+            pl.col("Years_of_Education").mean().alias("mean_years_of_education"),
+            (pl.col("Used_Internet_Last_30_Days") == 1).mean().alias("internet_share"),
+            pl.col("Education_Level").filter(head).first().alias("head_education_level"),
+            pl.col("Education_Level_label").filter(head).first().cast(pl.String).alias("head_education_label"),
+        )
+    )
+
+def household_consumption(lf):
+    """
+    Level 05 consumption summed to one row per household_id.
+    Only the leaf items of the taxonomy are summed, the sub-total
+    lines would count every family twice.
+    """
+    leaf_codes = build_item_taxonomy().leaves()["Item_Code"]
+    return (
+        lf
+        .filter(pl.col("Item_Code").cast(pl.Int64).is_in(leaf_codes.implode()))
+        .group_by("household_id")
+        .agg(
+            pl.col("Total_Consumption_Value").sum().alias("total_value"),
+            pl.col("OutOfHome_Consumption_Value").sum().alias("out_home_value"),
+        )
+    )
+
+def merge_households(persons_lf, items_lf):
+    """
+    1. Aggregate persons and items to households (one scan each,
+       only the needed columns are read)
+    2. Join them on the packed household_id
+    3. Sort by household_id, so lookups are binary searches
+    """
+    return (
+        household_members(persons_lf)
+        .join(household_consumption(items_lf), on="household_id", how="inner")
+        .with_columns(
+            out_of_home_share=pl.when(pl.col("total_value") > 0)
+                            .then(pl.col("out_home_value") / pl.col("total_value"))
+                            .otherwise(0),
+        )
+        .sort("household_id")
+        .collect()
+        .set_sorted("household_id")
+    )
+
+@st.cache_resource
+def load_households(level_02_path=LEVEL_02_PATH, level_05_path=LEVEL_05_PATH):
+    # Materialized once per process and shared by both pages
+    return merge_households(scan_level_02(level_02_path), scan_level_05(level_05_path))
+
+def lookup_households(households, household_ids):
+    """
+    Rows of `households` for the given ids, by binary search on the
+    sorted household_id. Ids without consumption rows are skipped.
+    """
+    ids = np.unique(np.asarray(household_ids, dtype=np.uint64))
+    keys = households["household_id"].to_numpy()
+
+    positions = np.searchsorted(keys, ids)
+    found = positions < len(keys)
+    found[found] = keys[positions[found]] == ids[found]
+
+    return households[positions[found]]
+
+def out_of_home_share_by_education(households, weight=None):
+    """
+    Share of the consumption value spent out of home, by the education
+    level of the household head (ratio of the summed values, of the
+    weighted totals with a `weight`), with its sub-sample standard error.
+    """
+    if weight is None:
+        out_home, total = pl.col("out_home_value").sum(), pl.col("total_value").sum()
+    else:
+        out_home, total = weighted_total("out_home_value", weight), weighted_total("total_value", weight)
+
+    share = (
+        subsample_estimates(
+            households.drop_nulls("head_education_level"),
+            ["head_education_level", "head_education_label"],
+            totals={"out_home": out_home, "total": total, "households": pl.len()},
+            ratios={"out_of_home_share": ("out_home", "total")},
+        )
+        .with_columns((pl.col("out_home") / pl.col("total")).alias("out_of_home_share"))
+        .sort("head_education_level")
+    )
+
+    return px.bar(
+        share,
+        x="out_of_home_share",
+        y="head_education_label",
+        error_x="out_of_home_share_se",
+        orientation="h",
+        hover_data=["households"],
+        title="Out of Home Share of Consumption Value by Education of the Head",
+    )
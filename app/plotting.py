@@ -0,0 +1,211 @@
+import numpy as np
+import polars as pl
+import plotly.express as px
+import plotly.graph_objects as go
+import plotly.io as pio
+import streamlit as st
+
+from app.cache import TTLCache
+from app.weights import sorted_for_quantiles, weighted_mean, weighted_quantile
+
+@st.cache_resource
+def figure_cache():
+    # Serialized figure JSON shared by every session of the process
+    return TTLCache(maxsize=512, ttl=3600)
+
+def cached_figure(chart_id, key, build):
+    """
+    Figure `chart_id` for `key` (dataset fingerprint, filter state,
+    category, ...), built with `build()` only on a cache miss.
+    """
+    fig_json = figure_cache().get_or_compute(
+        (chart_id, *key),
+        lambda: build().to_json()
+    )
+    return pio.from_json(fig_json)
+
+# Default point budget of a scatter plot sent to the browser
+MAX_SCATTER_POINTS = 20_000
+
+def stratified_sample(df, by, max_points=MAX_SCATTER_POINTS, seed=42):
+    """
+    Keep at most `max_points` rows of a pandas or polars frame.
+    Every value of `by` (the colour group) keeps its share of the rows,
+    quotas are rounded with the largest remainder method.
+    Returns the sampled frame and the number of rows dropped.
+    """
+    n_rows = len(df)
+    if n_rows <= max_points:
+        return df, 0
+
+    groups = np.asarray(df[by])
+    _, codes, counts = np.unique(groups.astype(str), return_inverse=True, return_counts=True)
+
+    exact = counts * (max_points / n_rows)
+    quotas = np.floor(exact).astype(int)
+    remainder = max_points - quotas.sum()
+    quotas[np.argsort(exact - quotas)[::-1][:remainder]] += 1
+
+    rng = np.random.default_rng(seed)
+    order = np.argsort(codes, kind="stable")
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+
+    kept = np.sort(np.concatenate([
+        rng.choice(order[start:start + count], size=quota, replace=False)
+        for start, count, quota in zip(starts, counts, quotas)
+    ]))
+
+    sample = df.iloc[kept] if hasattr(df, "iloc") else df[kept]
+    return sample, n_rows - len(kept)
+
+def add_points_note(fig, shown, total):
+    """
+    Note on the chart of how many of the points are drawn.
+    """
+    if shown >= total:
+        return fig
+
+    return add_chart_note(
+        fig, f"Showing {shown:,} of {total:,} points ({total - shown:,} dropped)"
+    )
+
+def add_chart_note(fig, text):
+    fig.add_annotation(
+        text=text,
+        xref="paper",
+        yref="paper",
+        x=1,
+        y=1.06,
+        xanchor="right",
+        showarrow=False,
+        font=dict(size=11, color="gray"),
+    )
+    return fig
+
+# Outliers drawn per box, the rest are only counted in the statistics
+MAX_BOX_OUTLIERS = 200
+
+def box_stats(df, value, by=None, max_outliers=MAX_BOX_OUTLIERS, seed=42, weight=None):
+    """
+    Box plot statistics of `value` per `by` group in one Polars group_by:
+    quartiles, mean, Tukey whiskers (most extreme values within 1.5 IQR)
+    and a capped random sample of the outliers.
+    With a `weight` column the quartiles and mean are survey weighted,
+    the rows are sorted by `value` once for all the groups.
+    """
+    v = pl.col(value)
+    lf = df.lazy()
+    if weight is None:
+        q1 = v.quantile(0.25, "linear")
+        median = v.median()
+        q3 = v.quantile(0.75, "linear")
+        mean = v.mean()
+    else:
+        lf = sorted_for_quantiles(lf, value)
+        q1 = weighted_quantile(value, 0.25, weight)
+        median = weighted_quantile(value, 0.5, weight)
+        q3 = weighted_quantile(value, 0.75, weight)
+        mean = weighted_mean(value, weight)
+
+    low = q1 - 1.5 * (q3 - q1)
+    high = q3 + 1.5 * (q3 - q1)
+
+    # A single literal key when there are no groups, nothing to sort
+    # then (sorting by it fails on an empty frame)
+    stats = (
+        lf
+        .group_by(by or [pl.lit(value).alias("box")])
+        .agg(
+            q1.alias("q1"),
+            median.alias("median"),
+            q3.alias("q3"),
+            mean.alias("mean"),
+            v.count().alias("count"),
+            v.filter(v >= low).min().alias("lowerfence"),
+            v.filter(v <= high).max().alias("upperfence"),
+            v.filter((v < low) | (v > high)).shuffle(seed).head(max_outliers).alias("outliers"),
+        )
+    )
+    if by:
+        stats = stats.sort(by)
+
+    return stats.collect()
+
+def box_traces(stats, x=None, color=None):
+    """
+    go.Box traces built from precomputed `box_stats`, one per colour
+    group, plus the sampled outliers as markers in the same offset group.
+    """
+    if stats.height == 0:
+        return []
+
+    if color is None:
+        groups = [(None, stats)]
+    else:
+        # eq_missing, so rows with a null colour form their own group
+        groups = [(name, stats.filter(pl.col(color).eq_missing(name))) for name in stats[color].unique(maintain_order=True)]
+
+    palette = px.colors.qualitative.Plotly
+    traces = []
+    for i, (name, part) in enumerate(groups):
+        positions = part[x].to_list() if x else part["box"].to_list()
+        trace_name = str(name) if color is not None else str(positions[0])
+        marker_color = palette[i % len(palette)]
+
+        traces.append(go.Box(
+            x=positions,
+            q1=part["q1"].to_list(),
+            median=part["median"].to_list(),
+            q3=part["q3"].to_list(),
+            mean=part["mean"].to_list(),
+            lowerfence=part["lowerfence"].to_list(),
+            upperfence=part["upperfence"].to_list(),
+            name=trace_name,
+            legendgroup=trace_name,
+            offsetgroup=trace_name,
+            marker_color=marker_color,
+            boxpoints=False,
+        ))
+
+        outliers = part.select(
+            pl.Series("x", positions),
+            pl.col("outliers"),
+        ).explode("outliers").drop_nulls("outliers")
+
+        traces.append(go.Scatter(
+            x=outliers["x"].to_list(),
+            y=outliers["outliers"].to_list(),
+            mode="markers",
+            name=trace_name,
+            legendgroup=trace_name,
+            offsetgroup=trace_name,
+            showlegend=False,
+            marker=dict(color=marker_color, size=4, opacity=0.6),
+        ))
+
+    return traces
+
+def box_figure(df, value, x=None, color=None, title=None, weight=None):
+    """
+    Drop-in for `px.box(df, x=x, y=value, color=color)` that only ships
+    the box statistics and an outlier sample to the browser.
+    """
+    by = [col for col in (x, color) if col is not None]
+    return box_stats_figure(box_stats(df, value, by=by, weight=weight), value, x, color, title)
+
+def box_stats_figure(stats, value, x=None, color=None, title=None):
+    """
+    Box figure of statistics in the `box_stats` layout, however
+    they were computed.
+    """
+    fig = go.Figure(box_traces(stats, x=x, color=color))
+    fig.update_layout(
+        title=title,
+        boxmode="group" if color else "overlay",
+        scattermode="group",
+        showlegend=color is not None,
+        legend_title_text=color,
+        xaxis_title=x,
+        yaxis_title=value,
+    )
+    return fig
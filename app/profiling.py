@@ -0,0 +1,102 @@
+import json
+import logging
+import time
+from contextlib import contextmanager
+
+import pandas as pd
+import streamlit as st
+
+from app.memory import process_rss_bytes
+
+logger = logging.getLogger(__name__)
+
+# One JSON record per stage on stderr, whatever the root logging setup
+# (the default WARNING level would drop them). The module is imported
+# once per process, so the handler is only added once.
+if not logger.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(asctime)s %(name)s %(message)s"))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+def _mb(nbytes):
+    return None if nbytes is None else round(nbytes / 1024**2, 2)
+
+class StageReporter:
+    """
+    Measures the real stages of a pipeline.
+    Every stage logs its wall time and the change of the process RSS
+    (which, unlike tracemalloc, sees the polars and numpy buffers) as
+    JSON and is written to the status widget (when there is one) on
+    `flush`. Stages only call Streamlit with `flush=True`, which the
+    page uses for its own stages; stages inside st.cache_* functions
+    must not, their lines are written by the next flush. The RSS delta
+    is approximate when several sessions run stages at once, and None
+    where the RSS is not available.
+    """
+
+    def __init__(self, pipeline, status=None):
+        self.pipeline = pipeline
+        self.status = status
+        self.records = []
+        self._flushed = 0
+
+    @contextmanager
+    def stage(self, name, flush=False):
+        rss_before = process_rss_bytes()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            rss_after = process_rss_bytes()
+            rss_delta = None if None in (rss_before, rss_after) else rss_after - rss_before
+
+            record = {
+                "pipeline": self.pipeline,
+                "stage": name,
+                "seconds": round(seconds, 4),
+                "rss_mb": _mb(rss_after),
+                "rss_delta_mb": _mb(rss_delta),
+            }
+            self.records.append(record)
+            logger.info(json.dumps(record))
+
+            if flush:
+                self.flush()
+
+    def flush(self):
+        """
+        Write the stages finished since the last flush to the status widget.
+        """
+        if self.status is not None:
+            for record in self.records[self._flushed:]:
+                line = f"{record['stage']}: {record['seconds']:.2f}s"
+                if record["rss_delta_mb"] is not None:
+                    line += f", RSS {record['rss_delta_mb']:+.1f} MB"
+                self.status.write(line)
+        self._flushed = len(self.records)
+
+    def total_seconds(self):
+        return sum(record["seconds"] for record in self.records)
+
+    def to_dataframe(self):
+        return pd.DataFrame(self.records, columns=["pipeline", "stage", "seconds", "rss_mb", "rss_delta_mb"])
+
+def pipeline_status(label):
+    """
+    Status widget + reporter for a pipeline. Call `finish_status` once
+    the stages are done. Only the stage lines are written into the
+    widget, so charts built in between stay where the page puts them.
+    """
+    status = st.status(label, expanded=True)
+    return StageReporter(label, status)
+
+def finish_status(reporter):
+    reporter.flush()
+    reporter.status.update(
+        label=f"🎉 {reporter.pipeline}: {reporter.total_seconds():.2f}s",
+        state="complete",
+        expanded=False,
+    )
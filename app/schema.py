@@ -0,0 +1,146 @@
+import numpy as np
+import polars as pl
+
+# Final dtypes of the built tables. Codes use the narrowest unsigned
+# type that holds them, labels and constant strings are dictionary
+# encoded. Casts are strict, a value that does not fit fails the build.
+
+_SURVEY_COLUMNS = {
+    "Survey_Name": pl.Categorical,
+    "Year": pl.UInt16,
+    "FSU_Serial_No": pl.UInt16,
+    "Sector": pl.UInt8,
+    "State": pl.UInt8,
+    "NSS_Region": pl.UInt8,
+    "District": pl.UInt8,
+    "Stratum": pl.UInt8,
+    "Sub_stratum": pl.UInt8,
+    "Panel": pl.UInt8,
+    "Sub_sample": pl.UInt8,
+    "FOD_Sub_Region": pl.UInt16,
+    "Sample_SU_No": pl.UInt8,
+    "Sample_Sub_Division_No": pl.UInt8,
+    "Second_Stage_Stratum_No": pl.UInt8,
+    "Sample_Household_No": pl.UInt8,
+    "Level": pl.UInt8,
+}
+
+_INGEST_COLUMNS = {
+    # Summed as is (population counts), kept at its raw width
+    "Multiplier": pl.Int64,
+    "Sector_label": pl.Categorical,
+    "State_label": pl.Categorical,
+    "ingest_timestamp": pl.Categorical,
+    "ingest_date": pl.Categorical,
+}
+
+LEVEL_02_SCHEMA = {
+    **_SURVEY_COLUMNS,
+    "Questionnaire_No": pl.Categorical,
+    "Person_Serial_No": pl.UInt8,
+    "Relation_to_Head": pl.UInt8,
+    "Gender": pl.UInt8,
+    "Age": pl.UInt8,
+    "Marital_Status": pl.UInt8,
+    "Education_Level": pl.UInt8,
+    "Years_of_Education": pl.UInt8,
+    "Used_Internet_Last_30_Days": pl.UInt8,
+    "Days_Away_From_Home_Last_30_Days": pl.UInt8,
+    "Meals_Usually_Taken_Per_Day": pl.UInt8,
+    "Meals_From_School": pl.UInt8,
+    "Meals_From_Employer": pl.UInt8,
+    "Meals_Other": pl.UInt8,
+    "Meals_On_Payment": pl.UInt8,
+    "Meals_At_Home": pl.UInt8,
+    "Revisit_Status": pl.UInt8,
+    "FDQ_Original_Member": pl.UInt8,
+    **_INGEST_COLUMNS,
+    "Relation_to_Head_label": pl.Categorical,
+    "Gender_label": pl.Categorical,
+    "Marital_Status_label": pl.Categorical,
+    "Education_Level_label": pl.Categorical,
+    "Used_Internet_Last_30_Days_label": pl.Boolean,
+}
+
+LEVEL_05_SCHEMA = {
+    **_SURVEY_COLUMNS,
+    "Questionnaire_No": pl.Boolean,
+    "Item_Code": pl.UInt16,
+    "OutOfHome_Consumption_Quantity": pl.Float64,
+    "OutOfHome_Consumption_Value": pl.Float64,
+    "Total_Consumption_Quantity": pl.Float64,
+    "Total_Consumption_Value": pl.Int64,
+    "Source": pl.UInt8,
+    **_INGEST_COLUMNS,
+}
+
+# Columns the raw files store as text although they hold numbers,
+# blanks and other junk become null
+LENIENT_COLUMNS = {
+    "OutOfHome_Consumption_Quantity",
+    "OutOfHome_Consumption_Value",
+}
+
+def cast_to_schema(lf, schema:dict):
+    """
+    Cast every column of `schema` to its final dtype, in schema order.
+    """
+    return lf.select([
+        pl.col(col).cast(dtype, strict=col not in LENIENT_COLUMNS)
+        for col, dtype in schema.items()
+    ])
+
+# Narrowest first, with the value range each holds
+_UNSIGNED_DTYPES = [(pl.UInt8, np.uint8), (pl.UInt16, np.uint16), (pl.UInt32, np.uint32), (pl.UInt64, np.uint64)]
+_SIGNED_DTYPES = [(pl.Int8, np.int8), (pl.Int16, np.int16), (pl.Int32, np.int32), (pl.Int64, np.int64)]
+
+# A string column is dictionary encoded when it has fewer distinct
+# values than this share of its rows and its strings take more than
+# the 4 bytes per row of the Categorical codes
+DICTIONARY_MAX_RATIO = 0.5
+
+# Measures keep their width, arithmetic on narrow integers wraps around
+MEASURE_COLUMNS = {"Total_Consumption_Value", "Multiplier"}
+
+def narrowest_int_dtype(low, high):
+    dtypes = _UNSIGNED_DTYPES if low >= 0 else _SIGNED_DTYPES
+    for dtype, np_dtype in dtypes:
+        info = np.iinfo(np_dtype)
+        if info.min <= low and high <= info.max:
+            return dtype
+
+    return pl.Int64
+
+def downcast(df):
+    """
+    Integer columns to the narrowest type holding their values,
+    low cardinality strings to Categorical. The ranges and distinct
+    counts of all the columns are computed in one pass.
+    """
+    int_cols = [
+        col for col, dtype in df.schema.items()
+        if dtype.is_integer() and col not in MEASURE_COLUMNS
+    ]
+    str_cols = [col for col, dtype in df.schema.items() if dtype == pl.String]
+
+    stats = df.select(
+        *[pl.col(col).min().alias(f"{col}_min") for col in int_cols],
+        *[pl.col(col).max().alias(f"{col}_max") for col in int_cols],
+        *[pl.col(col).n_unique().alias(f"{col}_n_unique") for col in str_cols],
+    ).row(0, named=True)
+
+    casts = {}
+    for col in int_cols:
+        low, high = stats[f"{col}_min"], stats[f"{col}_max"]
+        if low is None:
+            continue
+        dtype = narrowest_int_dtype(low, high)
+        if dtype != df.schema[col]:
+            casts[col] = dtype
+
+    for col in str_cols:
+        few_values = stats[f"{col}_n_unique"] <= DICTIONARY_MAX_RATIO * df.height
+        if few_values and df[col].estimated_size() > 4 * df.height:
+            casts[col] = pl.Categorical
+
+    return df.cast(casts) if casts else df
@@ -0,0 +1,93 @@
+import json
+import os
+
+import polars as pl
+
+from app.loaders import DATA_DIR, LEVEL_02_PATH, LEVEL_05_PATH, file_fingerprint, resolve_source, scan_level_02, scan_level_05
+from app.l05_cube import load_consumption_cube
+from app.schema import downcast
+
+# Uncompressed Arrow IPC copies of the tables, memory-mapped by every
+# worker process so the OS page cache holds a single physical copy
+STORE_DIR = DATA_DIR / "ipc"
+
+def ipc_path(name):
+    return STORE_DIR / f"{name}.arrow"
+
+def _fingerprint_path(name):
+    return STORE_DIR / f"{name}.json"
+
+def write_ipc_table(name, df, source_path):
+    """
+    Write `df` as an uncompressed IPC file, tagged with the fingerprint
+    of the parquet file it was built from and its column list. Files
+    are written under a temporary name and renamed, so a running worker
+    never maps a half written file.
+    """
+    STORE_DIR.mkdir(parents=True, exist_ok=True)
+    path = ipc_path(name)
+
+    tmp_path = path.with_suffix(".arrow.tmp")
+    df.rechunk().write_ipc(tmp_path, compression="uncompressed")
+    os.replace(tmp_path, path)
+
+    with open(_fingerprint_path(name), "w") as f:
+        json.dump({
+            "source": str(source_path),
+            "fingerprint": file_fingerprint(resolve_source(source_path)),
+            "columns": df.columns,
+        }, f)
+
+def is_fresh(name, source_path, columns):
+    """
+    The stored table was built from the current source file, by a
+    loader producing exactly `columns` (a loader change adding or
+    dropping a column makes it stale, like the source changing).
+    """
+    try:
+        with open(_fingerprint_path(name)) as f:
+            tag = json.load(f)
+    except (OSError, ValueError):
+        return False
+
+    return (
+        ipc_path(name).exists()
+        and tag.get("fingerprint") == file_fingerprint(resolve_source(source_path))
+        and set(tag.get("columns", [])) == set(columns)
+    )
+
+def read_ipc_table(name):
+    # No rechunk, it would copy the mapped buffers into process memory
+    return pl.read_ipc(ipc_path(name), memory_map=True, rechunk=False)
+
+def load_table(name, source_path, build, columns):
+    """
+    Memory-mapped IPC table when it is up to date with its parquet
+    source and holds the `columns` of the current loader, otherwise
+    `build()` from the parquet file.
+    """
+    if is_fresh(name, source_path, columns):
+        return read_ipc_table(name)
+
+    return build()
+
+def scan_columns(scan, path):
+    # Columns a scan_* loader yields, read from the schema only
+    return scan(path).collect_schema().names()
+
+# name -> (parquet source, build from parquet)
+TABLES = {
+    "BL02": (LEVEL_02_PATH, lambda: downcast(scan_level_02(LEVEL_02_PATH).collect())),
+    "BL05": (LEVEL_05_PATH, lambda: downcast(scan_level_05(LEVEL_05_PATH).collect())),
+    "BL05.cube": (LEVEL_05_PATH, lambda: load_consumption_cube(LEVEL_05_PATH)),
+}
+
+def convert_all():
+    for name, (source_path, build) in TABLES.items():
+        df = build()
+        write_ipc_table(name, df, source_path)
+        print(f"{ipc_path(name)}: {df.height} rows, {df.estimated_size() / 1024**2:.1f} MB")
+
+if __name__ == "__main__":
+    # Conversion step: python -m app.store
+    convert_all()
@@ -0,0 +1,122 @@
+from dataclasses import dataclass
+
+import polars as pl
+import streamlit as st
+
+from app.cache import TTLCache
+from app.loaders import filter_state
+from app.variance import SUB_SAMPLE
+from app.weights import WEIGHT, value_counts, weight_of
+
+# Rows of the summary table, in the order of `DataFrame.describe`
+SUMMARY_STATISTICS = ["count", "null_count", "mean", "std", "min", "25%", "50%", "75%", "max"]
+
+# Columns counted on the Level 02 Statistic tab and count charts
+LEVEL_02_COUNT_COLUMNS = [
+    "Years_of_Education",
+    "Used_Internet_Last_30_Days",
+    "Age",
+    "Education_Level",
+    "Marital_Status_label",
+    "Gender_label",
+]
+
+
+@dataclass(frozen=True)
+class SummaryBundle:
+    """
+    Everything the Statistic tabs and count charts show about the
+    filtered rows. `describe` has the layout of `DataFrame.describe`
+    (statistic column, then one Float64 column per input column, only
+    counts for the non-numeric ones). `count_parts` maps a counted
+    column to its [column, Sub_sample, count, weight] rows.
+    """
+    rows: int
+    households: int
+    describe: pl.DataFrame
+    count_parts: dict
+
+    def value_counts(self, col, weight=None):
+        """
+        `weights.value_counts` of the filtered rows, from the parts.
+        """
+        return value_counts(self.count_parts[col], col, weight).sort(col, nulls_last=True)
+
+
+def describe_exprs(col, dtype):
+    """
+    The SUMMARY_STATISTICS of one column, as a single list expression.
+    """
+    c = pl.col(col)
+    counts = [c.count(), c.null_count()]
+    if dtype.is_numeric():
+        values = [
+            c.mean(),
+            c.std(),
+            c.min(),
+            *[c.quantile(q, "nearest") for q in (0.25, 0.5, 0.75)],
+            c.max(),
+        ]
+    else:
+        values = [pl.lit(None)] * 7
+
+    return pl.concat_list([expr.cast(pl.Float64) for expr in counts + values]).alias(col)
+
+
+def summary_bundle(lf, count_columns=(), key_column="household_id"):
+    """
+    Row and household counts, describe and value counts of `lf`, all
+    evaluated together in one `collect_all`: the frames share the scan
+    and filter of `lf`, and the repeated column expressions are only
+    computed once (common subexpression elimination). Value counts are
+    taken per sub-sample, counted and weighted, so the weighted counts
+    and standard errors of the count charts come from the same pass.
+    """
+    schema = lf.collect_schema()
+    columns = list(schema.names())
+
+    totals = lf.select(
+        pl.len().alias("rows"),
+        pl.col(key_column).n_unique().alias("households"),
+    )
+    describe = (
+        lf
+        .select(describe_exprs(col, dtype) for col, dtype in schema.items())
+        .explode(columns)
+        .select(pl.Series("statistic", SUMMARY_STATISTICS), *columns)
+    )
+    counts = [
+        lf.group_by(col, SUB_SAMPLE).agg(
+            pl.len().alias("count"),
+            weight_of(WEIGHT).sum().alias("weight"),
+        )
+        for col in count_columns
+    ]
+
+    # Subplan and subexpression elimination are on by default
+    totals, describe, *counts = pl.collect_all([totals, describe, *counts])
+
+    return SummaryBundle(
+        rows=totals["rows"][0],
+        households=totals["households"][0],
+        describe=describe,
+        count_parts=dict(zip(count_columns, counts)),
+    )
+
+
+@st.cache_resource
+def summary_cache():
+    # One bounded cache per process, shared by every session
+    return TTLCache(maxsize=128, ttl=3600)
+
+
+def cached_summary(name, lf, fingerprint, filter_map:dict, count_columns=()):
+    """
+    `summary_bundle` of the filtered rows of table `name`, cached on
+    (dataset fingerprint, normalized filter state).
+    """
+    key = (name, fingerprint, filter_state(filter_map))
+    return summary_cache().get_or_compute(
+        key,
+        lambda: summary_bundle(lf, count_columns)
+    )
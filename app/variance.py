@@ -0,0 +1,46 @@
+import polars as pl
+
+# NSS interpenetrating sub-samples, both are a full sample of the design
+SUB_SAMPLE = "Sub_sample"
+
+def _part(name, sub_sample):
+    # Float, a difference of unsigned counts (pl.len) would wrap around
+    return pl.col(name).cast(pl.Float64).filter(pl.col(SUB_SAMPLE) == sub_sample).sum()
+
+def subsample_estimates(lf, by, totals:dict, ratios:dict=None):
+    """
+    Totals (name -> aggregation) per `by` group with their sub-sample
+    standard error, in one grouped pass over the rows.
+
+    Each sub-sample estimates a total as twice its own part, so with
+    theta_s = 2 * T_s the NSS estimator SE = |theta_1 - theta_2| / 2
+    is |T_1 - T_2|. Ratios (name -> (numerator, denominator) totals)
+    get SE = |R_1 - R_2| / 2 from the ratios of the two sub-samples.
+    The `_se` columns are null when the rows do not hold both
+    sub-samples, e.g. under a Sub_sample filter.
+    """
+    by = list(by)
+    ratios = ratios or {}
+
+    # One row per (group, sub-sample), a few hundred rows at most
+    parts = lf.lazy().group_by(*by, SUB_SAMPLE).agg(**totals).collect()
+    both = parts[SUB_SAMPLE].n_unique() == 2
+
+    def se(expr):
+        return expr if both else pl.lit(None, dtype=pl.Float64)
+
+    def ratio(num, den, sub_sample):
+        den_part = _part(den, sub_sample)
+        return pl.when(den_part > 0).then(_part(num, sub_sample) / den_part)
+
+    return parts.group_by(by).agg(
+        *[pl.col(name).sum() for name in totals],
+        *[
+            se((_part(name, 1) - _part(name, 2)).abs()).alias(f"{name}_se")
+            for name in totals
+        ],
+        *[
+            se((ratio(num, den, 1) - ratio(num, den, 2)).abs() / 2).alias(f"{name}_se")
+            for name, (num, den) in ratios.items()
+        ],
+    )
@@ -0,0 +1,60 @@
+import polars as pl
+
+from app.variance import subsample_estimates
+
+# NSS survey weight, carried by every row of BL02 and BL05
+WEIGHT = "Multiplier"
+
+# NSS multipliers carry two implied decimals: the BL02 persons sum
+# to 10.9 billion, i.e. 109 million people once divided by 100
+WEIGHT_SCALE = 100
+
+def weight_of(weight=WEIGHT):
+    # Float, products with narrow integer columns would wrap around
+    return pl.col(weight).cast(pl.Float64) / WEIGHT_SCALE
+
+def weighted_total(col, weight=WEIGHT):
+    """
+    Population total of `col`.
+    """
+    return (pl.col(col).cast(pl.Float64) * weight_of(weight)).sum()
+
+def weighted_mean(col, weight=WEIGHT):
+    """
+    Population mean of `col`, rows where `col` is null are left out.
+    """
+    w = weight_of(weight).filter(pl.col(col).is_not_null())
+    return weighted_total(col, weight) / w.sum()
+
+def weighted_quantile(col, quantile, weight=WEIGHT):
+    """
+    Smallest value of `col` whose cumulative weight reaches `quantile`
+    of the total. Rows must already be sorted by `col` and without nulls
+    in it (see `sorted_for_quantiles`), the expression only scans the
+    cumulative weights, so any number of quantiles share one sort.
+    """
+    w = weight_of(weight)
+    return pl.col(col).filter(w.cum_sum() >= quantile * w.sum()).first()
+
+def sorted_for_quantiles(lf, col):
+    return lf.filter(pl.col(col).is_not_null()).sort(col)
+
+def value_counts(parts, col, weight=None):
+    """
+    `df[col].value_counts()` with the sub-sample standard error of every
+    count, the counts are the summed `weight` (estimated population)
+    when one is given. Built from counts already taken per
+    (col, Sub_sample), in rows of [col, Sub_sample, count, weight] where
+    weight is the summed `weight_of`, e.g. by `summary_bundle` or the
+    sketches. The result has [col, "count", "count_se"] columns.
+    """
+    count = pl.col("count" if weight is None else "weight").sum()
+    return subsample_estimates(parts, [col], totals={"count": count})
+
+def weighted_title(fig, weight=None):
+    """
+    Mark the title of a figure built from weighted estimates.
+    """
+    if weight is not None:
+        fig.update_layout(title_text=f"{fig.layout.title.text} (weighted by {weight})")
+    return fig
@@ -1,23 +1,60 @@
-import time
 import polars as pl
 import streamlit as st
-from pathlib import Path
-import plotly.express as px
 
 from app.l02_functions import (
     pca_features,
+    years_of_education_bar,
+    internet_education_gender_box,
+    internet_education_box,
+    internet_usage_pie,
+    internet_age_gender_box,
+    age_box,
+    age_histogram,
+    age_count_bar,
+    age_box_from_histogram,
+    age_histogram_from_histogram,
+    education_level_bar,
+    marital_status_pie,
+    marital_status_education_heatmap,
+    relation_age_gender_box,
+    age_days_away_scatter,
+    gender_pie,
     correlation_df,
     apply_pca,
+    load_pca_matrix,
+    apply_streaming_pca,
+    project_rows,
+    project_streaming,
     explained_df_on_pca,
     cumulative_explained_variance_graph,
     loadings_df,
     pca_gender_2d_graphs,
     education_pca_3d,
+    kmeans_sweep_on_pca,
+    elbow_silhouette_graphs,
     cluster_and_pca_on_overall_data,
-    loading_animation_pca_time,
 )
-
-path = Path("data") / "BL02.parquet"
+from app.plotting import MAX_SCATTER_POINTS, cached_figure
+from app.profiling import pipeline_status, finish_status
+
+from app.loaders import (
+    LEVEL_02_PATH,
+    LEVEL_02_FILTER_COLUMNS,
+    file_fingerprint,
+    filter_state,
+    scan_level_02,
+)
+from app.filter_index import build_filter_index
+from app.l02_covariance import build_covariance_partials
+from app.l02_sketches import build_distribution_sketches, histogram_counts
+from app.memory import column_memory_report, memory_report
+from app.merge import load_households, lookup_households, out_of_home_share_by_education
+from app.schema import downcast
+from app.store import load_table, scan_columns
+from app.summary import LEVEL_02_COUNT_COLUMNS, cached_summary
+from app.weights import WEIGHT, weighted_title
+
+path = LEVEL_02_PATH
 
 st.set_page_config(
     page_title="Level 02",
@@ -26,23 +63,62 @@ st.set_page_config(
 
 st.title("Level 02")
 
-@st.cache_data
-def load_data():
-    df = pl.read_parquet(path)
-    return df
+@st.cache_resource
+def load_data(path):
+    # Loaded once per process and shared read-only by every session,
+    # sessions only gather their filtered rows from it. Memory-mapped
+    # from the IPC store when it is built (python -m app.store)
+    return load_table(
+        "BL02",
+        path,
+        lambda: downcast(scan_level_02(path).collect()).rechunk(),
+        columns=scan_columns(scan_level_02, path),
+    )
+
+@st.cache_resource
+def load_column_report(path):
+    # Raw parquet dtypes against the shared table, computed once
+    return column_memory_report(pl.read_parquet(path), load_data(path))
 
-df = load_data()
+@st.cache_resource
+def load_filter_index(path):
+    # Built once per dataset and shared by every rerun
+    return build_filter_index(load_data(path), LEVEL_02_FILTER_COLUMNS)
 
-fdf = df.clone()
+@st.cache_resource
+def load_covariance_partials(path):
+    # Per-cell sums of the PCA features, the correlation heatmap merges
+    # the selected cells instead of rescanning the filtered rows
+    return build_covariance_partials(load_data(path), pca_features, LEVEL_02_FILTER_COLUMNS)
+
+@st.cache_resource
+def load_distribution_sketches(path):
+    # Per-cell histograms of Age and Years of Education, merged
+    # for the selection instead of rescanning the rows
+    return build_distribution_sketches(load_data(path), LEVEL_02_FILTER_COLUMNS)
+
+df = load_data(path)
+filter_index = load_filter_index(path)
+filter_map = {}
 
 on = st.toggle("Activate Filter Options")
 if on:
     with st.expander("⚙️ Filters", expanded=True):
         
+        # Each selectbox only offers values still reachable
+        # under the selections made in the other ones
+        filter_map, filter_options = filter_index.cascade({
+            col: st.session_state.get(f"l02_filter_{col}", "All")
+            for col in LEVEL_02_FILTER_COLUMNS
+        })
+        
         def select(col_name):
+            key = f"l02_filter_{col_name}"
+            st.session_state[key] = filter_map[col_name]
             return st.selectbox(
                 col_name,
-                options=["All"] + sorted(df[col_name].unique().to_list())
+                options=["All"] + filter_options[col_name],
+                key=key,
             )
             
         FSU_Serial_No = select("FSU_Serial_No")
@@ -74,216 +150,206 @@ if on:
             # "Second_Stage_Stratum_No": Second_Stage_Stratum_No,
             "Sample_Household_No": Sample_Household_No,
         }
-        
-        for col, val in filter_map.items():
-            if val != "All":
-                fdf = fdf.filter(pl.col(col) == val)
-
-
-tab1, tab2, tab3, tab4, tab5, tab6, tab7, tab8, tab9 = st.tabs(
-    ["Statistic", "Year of Edu.", "Internet Used",
-     "Age", "Education Level", "Marital Status",
-     "Relation to Head", "Gender", "PCA"]   
-)
-
-with tab1:
-    st.subheader("Statistical Summary")
-    st.write(f"Data contains: {fdf.shape[0]}")
-    
-    with st.expander("Statistical Summary"):
-        st.dataframe(fdf.describe().to_pandas().T)
-    
-    with st.expander("Dataframe"):
-        st.subheader("Dataframe")
-        st.dataframe(fdf.head(20))
 
-with tab2:
-    with st.spinner("Year of Education Loading..."): 
-        fig = px.bar(
-            fdf['Years_of_Education'].value_counts(),
-            x='Years_of_Education',
-            y='count',
-            range_y=[0, 8_000],
-            title="Year of Education Distribution"
-        )
-        
-        st.plotly_chart(fig)
+# AND of the selected bitmaps, then a single gather
+fdf = filter_index.take(df, filter_map)
 
-        fig = px.box(
-            fdf,
-            x='Used_Internet_Last_30_Days',
-            y='Years_of_Education',
-            color='Gender',
-            title="Last used Internet w/ Gender w/ Age"
-        )
 
-        fig.update_layout(showlegend=True)
+weighted = st.toggle("Survey weighted (Multiplier)", key="l02_weighted")
+weight = WEIGHT if weighted else None
 
-        fig.update_xaxes(
-            tickvals=[1, 2],
-            ticktext=['Yes', 'No']
-        ) 
-        st.plotly_chart(fig)
+# Only the opened tab is built, its figures come from a cache keyed on
+# (chart id, dataset fingerprint, filter state, weighting)
+figure_key = (file_fingerprint(path), filter_state(filter_map), weighted)
 
-with tab3:
-    
-    fig = px.box(
-    fdf[['Used_Internet_Last_30_Days', 'Years_of_Education']],
-    x='Used_Internet_Last_30_Days',
-    y='Years_of_Education',
-    title="Relationship b/w Internet Used w/ Year of Edu  "
+def show_chart(build):
+    st.plotly_chart(
+        cached_figure(build.__name__, figure_key, lambda: weighted_title(build(fdf, weight=weight), weight))
     )
 
-    fig.update_xaxes(
-        tickvals=[1, 2],
-        ticktext=['Yes', 'No']
+def show_histogram_chart(build, sketches, col):
+    st.plotly_chart(
+        cached_figure(build.__name__, figure_key, lambda: weighted_title(
+            build(sketches.histogram(col, filter_map), weight=weight), weight
+        ))
     )
 
-    st.plotly_chart(fig)
-    
-    fig = px.pie(
-    fdf['Used_Internet_Last_30_Days'].value_counts(),
-    values='count',
-    names='Used_Internet_Last_30_Days', 
-    title='Internet Usage in Last 30 Days'
-    )
-    
-    fig.update_layout(showlegend=True)
-    st.plotly_chart(fig)
-
-    fig = px.box(
-        fdf[['Used_Internet_Last_30_Days', 'Age', 'Gender']],
-        x='Used_Internet_Last_30_Days',
-        y='Age',
-        color='Gender',
-        title="Last used Internet w/ Gender w/ Age"
+def summary():
+    # Counts, describe and value counts in one collect_all per filter
+    # state, shared by the Statistic tab and the count charts
+    return cached_summary(
+        "BL02", fdf.lazy(), file_fingerprint(path), filter_map, LEVEL_02_COUNT_COLUMNS
     )
 
-    fig.update_layout(showlegend=True)
+def show_count_chart(build, col, sketches=None):
+    # Counts from the merged sketches when the filter selects whole
+    # cells, from the summary bundle otherwise
+    def counts():
+        if sketches is not None and sketches.can_merge(filter_map):
+            return histogram_counts(sketches.histogram(col, filter_map), col, weight)
+        return summary().value_counts(col, weight)
 
-    fig.update_xaxes(
-        tickvals=[1, 2],
-        ticktext=['Yes', 'No']
+    st.plotly_chart(
+        cached_figure(build.__name__, figure_key, lambda: weighted_title(build(counts(), weight=weight), weight))
     )
-    st.plotly_chart(fig)
-
-with tab4:
-    fig = px.box(
-        fdf['Age'],
-        title="Age Boxplot"
-        ) 
-
-    st.plotly_chart(fig)
 
-    fig = px.histogram(df, x='Age', title="Age Distribution")
-    st.plotly_chart(fig)
+TABS = [
+    "Statistic", "Year of Edu.", "Internet Used",
+    "Age", "Education Level", "Marital Status",
+    "Relation to Head", "Gender", "Household", "PCA"
+]
 
+tab = st.segmented_control(
+    "Tabs",
+    options=TABS,
+    default=TABS[0],
+    key="l02_tab",
+    label_visibility="collapsed",
+) or TABS[0]
 
-    fig = px.bar(
-        fdf['Age'].value_counts(),
-        x='Age',
-        y='count',
-        text_auto=True,
-        title="Age Count")
-    st.plotly_chart(fig)
+if tab == "Statistic":
+    bundle = summary()
 
-with tab5:
-
-    fig = px.bar(
-        fdf['Education_Level'].value_counts(),
-        x='Education_Level',
-        y='count',
-        text_auto=True,
-        title="Education Level Count",
-        width=800,
-    )
+    st.subheader("Statistical Summary")
+    st.write(f"Data contains: {bundle.rows}")
+    st.write(f"Households: {bundle.households}")
     
-    st.plotly_chart(fig)
-
-with tab6:
-    fig = px.pie(
-    fdf['Marital_Status_label'].value_counts(),
-    values='count',
-    names='Marital_Status_label',
-    title="Marital Status Pie Chart"
-    )
+    with st.expander("Statistical Summary"):
+        st.dataframe(bundle.describe.to_pandas().T)
 
-    fig.update_layout(showlegend=True)
-    st.plotly_chart(fig)
+    with st.expander("Value Counts"):
+        for count_col, col in zip(st.columns(3) * 2, LEVEL_02_COUNT_COLUMNS):
+            with count_col:
+                st.dataframe(bundle.value_counts(col).select(col, "count"), hide_index=True)
+    
+    with st.expander("Dataframe"):
+        st.subheader("Dataframe")
+        st.dataframe(fdf.head(20))
 
-    fig = px.density_heatmap(
-        fdf[['Marital_Status', 'Education_Level']], 
-        x='Marital_Status', 
-        y='Education_Level', 
-        text_auto=True, 
-        title='Marital Status by Education Level'
-    )
+    with st.expander("Process Memory"):
+        st.dataframe(memory_report({
+            "BL02 table": df,
+            "BL02 filter index": filter_index,
+        }))
 
-    fig.update_xaxes(
-        tickvals=[1, 2, 3, 4],
-        ticktext=['Never Married', 'Currently Married', 'Widowed', 'Divorced/Separated']
-    )
-    st.plotly_chart(fig)
-
-with tab7:
-    fig = px.box(
-    fdf[['Relation_to_Head', 'Age', 'Gender']],
-    x='Relation_to_Head',
-    y='Age',
-    color='Gender',
-    title="Relation to Head w/ Gender w/ Age",
-    width=800,
-    )
+    with st.expander("Column Memory"):
+        st.dataframe(load_column_report(path))
 
-    st.plotly_chart(fig)
+elif tab == "Year of Edu.":
+    with st.spinner("Year of Education Loading..."): 
+        show_count_chart(years_of_education_bar, "Years_of_Education", load_distribution_sketches(path))
+        show_chart(internet_education_gender_box)
+
+elif tab == "Internet Used":
+    show_chart(internet_education_box)
+    show_count_chart(internet_usage_pie, "Used_Internet_Last_30_Days")
+    show_chart(internet_age_gender_box)
+
+elif tab == "Age":
+    sketches = load_distribution_sketches(path)
+    if sketches.can_merge(filter_map):
+        show_histogram_chart(age_box_from_histogram, sketches, "Age")
+        show_histogram_chart(age_histogram_from_histogram, sketches, "Age")
+    else:
+        show_chart(age_box)
+        show_chart(age_histogram)
+    show_count_chart(age_count_bar, "Age", sketches)
+
+elif tab == "Education Level":
+    show_count_chart(education_level_bar, "Education_Level")
+
+elif tab == "Marital Status":
+    show_count_chart(marital_status_pie, "Marital_Status_label")
+    show_chart(marital_status_education_heatmap)
+
+elif tab == "Relation to Head":
+    show_chart(relation_age_gender_box)
+    show_chart(age_days_away_scatter)
     
-    fig = px.scatter(
-        fdf[['Age', 'Gender', 'Days_Away_From_Home_Last_30_Days']],
-        x='Age', 
-        y='Days_Away_From_Home_Last_30_Days',
-        symbol='Gender',
-        title="Relationship between Age and Days Away by Gender"
-    )
+elif tab == "Gender":
+    show_count_chart(gender_pie, "Gender_label")
 
-    st.plotly_chart(fig)
-    
-with tab8:
-        fig = px.pie(
-            fdf['Gender_label'].value_counts(),
-            values='count',
-            names='Gender_label',
-            title="Gender Pie Chart"
-        )
+elif tab == "Household":
+    st.subheader("Household Consumption (Level 02 × Level 05)")
+    households = lookup_households(load_households(), fdf["household_id"])
+    st.write(f"Households with consumption: {households.height}")
 
-        fig.update_layout(showlegend=True)
+    st.plotly_chart(cached_figure(
+        "out_of_home_share_by_education",
+        figure_key,
+        lambda: weighted_title(out_of_home_share_by_education(households, weight=weight), weight),
+    ))
 
-        st.plotly_chart(fig)
+    with st.expander("Household Dataframe"):
+        st.dataframe(households.head(20))
 
-with tab9:
+elif tab == "PCA":
     st.subheader("PCA")
     op1, op2 = st.columns(2, gap="large")
     with op1:
-        n_components = st.slider("How components you want", 0,10, 10)
+        # The 3D scatter plots draw the first three components
+        n_components = st.slider("How components you want", 3, len(pca_features), len(pca_features))
     with op2:
-        n_clusters = st.slider("Cluster Size", 0, 10, 6)
+        n_clusters = st.slider("Cluster Size", 2, 10, 6)
+    
+    max_points = st.number_input(
+        "Max points per scatter plot",
+        min_value=1_000,
+        value=MAX_SCATTER_POINTS,
+        step=5_000,
+        help="Above this budget the PCA scatter plots draw a sample that keeps the colour group shares"
+    )
+    
+    streaming = st.toggle(
+        "Out-of-core PCA",
+        help="Stream the parquet file in batches instead of fitting on an in-memory copy"
+    )
     
     if st.button("Show PCA & Cluster"):
-        loading_animation_pca_time()
+        st.session_state["l02_show_pca"] = True
+    
+    if st.session_state.get("l02_show_pca") and fdf.height < max(n_clusters, 2):
+        st.warning("Not enough rows match the filters for PCA & Cluster.")
+    elif st.session_state.get("l02_show_pca"):
+        reporter = pipeline_status("Model training, Cluster and PCA")
+        
+        # The model is fitted once per dataset and component count,
+        # the filtered rows are only projected through it
+        if streaming:
+            pca = apply_streaming_pca(
+                path, n_components=n_components, _reporter=reporter
+            )
+            with reporter.stage("Projection", flush=True):
+                X_pca, X_pca_scaled = project_streaming(pca, path, filter_map)
+        else:
+            pca = apply_pca(
+                path, n_components=n_components, _reporter=reporter
+            )
+            _, X_scaled = load_pca_matrix(path)
+            with reporter.stage("Projection", flush=True):
+                X_pca, X_pca_scaled = project_rows(
+                    pca, X_scaled, filter_index.row_ids(filter_map)
+                )
+        
+        features_summary = fdf[pca_features].describe()
+        
+        with reporter.stage("Correlation", flush=True):
+            corr_df, corr_fig = correlation_df(
+                fdf, pca_features, load_covariance_partials(path), filter_map
+            )
         
         with st.expander("PCA contains features "):
-            st.dataframe(df[pca_features].describe())
+            st.dataframe(features_summary)
             
         with st.expander("Correlation graph"):
             t9_c1, t9_c2 = st.columns(2)
-            corr_df, fig = correlation_df(df, pca_features)
             with t9_c1:
-                st.plotly_chart(fig)
+                st.plotly_chart(corr_fig)
             with t9_c2:
                 st.dataframe(corr_df)
                 
         with st.expander("Elbow graph"):
             t9_c1, t9_c2 = st.columns(2)       
-            pca, X_pca, X_pca_scaled = apply_pca(df, n_components=n_components)
             with t9_c1:
                 explained_df = explained_df_on_pca(pca)
                 st.dataframe(explained_df)
@@ -294,17 +360,40 @@ with tab9:
         with st.expander("PCA Components & Graphs", expanded=True):
             t91, t92, t93 = st.tabs(["PCA on Education", "PCA on Gender", "Loading Dataframe" ])
             with t91:
-                pca_df_3d, fig = education_pca_3d(X_pca, df)
+                with reporter.stage("Figure build: PCA on Education", flush=True):
+                    pca_df_3d, fig = education_pca_3d(X_pca, fdf, max_points)
                 st.plotly_chart(fig)
             with t92:
-                fig = pca_gender_2d_graphs(X_pca, df)
+                with reporter.stage("Figure build: PCA on Gender", flush=True):
+                    fig = pca_gender_2d_graphs(X_pca, fdf, max_points)
                 st.plotly_chart(fig)
             with t93:
                 loadings = loadings_df(pca)
                 st.dataframe(loadings)
                             
         with st.expander("KMeans Clustering + PCA + Scatter Plot", expanded=True):
-            fig = cluster_and_pca_on_overall_data(X_pca_scaled, pca_df_3d, n_clusters=n_clusters)
-            st.plotly_chart(fig)
-            
-
+            cluster_slot = st.empty()
+            t9_c1, t9_c2 = st.columns(2)
+            elbow_slot, silhouette_slot = t9_c1.empty(), t9_c2.empty()
+            drawn = set()
+
+            def show_sweep(sweep):
+                # Called with the partial sweeps as the fits finish
+                if n_clusters in sweep.labels and "cluster" not in drawn:
+                    drawn.add("cluster")
+                    fig = cluster_and_pca_on_overall_data(
+                        pca_df_3d, sweep.labels[n_clusters], max_points
+                    )
+                    cluster_slot.plotly_chart(fig)
+
+                elbow_fig, silhouette_fig = elbow_silhouette_graphs(sweep)
+                elbow_slot.plotly_chart(elbow_fig)
+                silhouette_slot.plotly_chart(silhouette_fig)
+
+            sweep = kmeans_sweep_on_pca(X_pca_scaled, on_result=show_sweep, _reporter=reporter)
+            show_sweep(sweep)
+        
+        finish_status(reporter)
+        
+        with st.expander("Stage timings"):
+            st.dataframe(reporter.to_dataframe())
@@ -1,11 +1,13 @@
-import time
 import streamlit as st
-from pathlib import Path
 
 from app.l05_functions import(
     
-    load_level_05_data,
-    category_dict_to_dataframe,
+    load_level_05_table,
+    category_view,
+    category_view_cache,
+    category_rollup,
+    consumption_drill_down,
+    level_05_column_report,
     
     total_consumption_qty_by_category,
     total_consumption_value_by_category,
@@ -30,25 +32,20 @@ from app.l05_functions import(
     
     pca_kmeans_category_clustering,
     pca_2d_graph,
-    loading_status_for_pca
 )
+from app.filter_index import build_filter_index
+from app.memory import memory_report
+from app.merge import load_households, out_of_home_share_by_education
+from app.plotting import cached_figure
+from app.profiling import pipeline_status, finish_status
 
-from app.l05_categories import (  
-    category_mapping,
-    cereal_mapping,
-    pulses_mapping,
-    salt_sugar_mapping,
-    milk_mapping,
-    vegetables_mapping,
-    fruits_fresh_mapping,
-    fruits_dry_mapping,
-    nonveg_mapping,
-    edible_oil_mapping,
-    spices_mapping,
-    beverages_mapping,
-)
+from app.l05_categories import CATEGORY_FN_MAP
 
-LEVEL_05_PATH = Path("data") / "BL05.parquet"
+from app.loaders import LEVEL_05_PATH, file_fingerprint, filter_expr, filter_state
+from app.l05_cube import CUBE_COLUMNS, CUBE_FILTER_COLUMNS, load_consumption_cube, select_measures
+from app.store import load_table
+from app.summary import cached_summary
+from app.weights import WEIGHT, weighted_title
 
 st.set_page_config(
     page_title="Level 05",
@@ -57,23 +54,55 @@ st.set_page_config(
 
 st.title("Level 05")
 
-df = load_level_05_data(LEVEL_05_PATH)
-fdf = df.clone()
-
-CATEGORY_FN_MAP = {
-    "All Category": category_mapping,
-    "Cereal Family": cereal_mapping,
-    "Pulses Family": pulses_mapping,
-    "Salt & Sugar Family": salt_sugar_mapping,
-    "Milk Family": milk_mapping,
-    "Vegetables": vegetables_mapping,
-    "Fresh Fruits": fruits_fresh_mapping,
-    "Dry Fruits": fruits_dry_mapping,
-    "Non-Veg": nonveg_mapping,
-    "Edible Oil": edible_oil_mapping,
-    "Spices Mapping": spices_mapping,
-    "Beverages": beverages_mapping,
-}
+@st.cache_resource
+def load_cube(path):
+    # Rebuilt only when the fingerprint of the source file changes,
+    # memory-mapped from the IPC store when it is up to date
+    return load_table("BL05.cube", path, lambda: load_consumption_cube(path), columns=CUBE_COLUMNS)
+
+@st.cache_resource
+def load_filter_index(path):
+    # Built once per dataset and shared by every rerun
+    return build_filter_index(load_cube(path), CUBE_FILTER_COLUMNS)
+
+# Shared by every session of the process, never copied per session
+df = load_level_05_table(LEVEL_05_PATH)
+cube = load_cube(LEVEL_05_PATH)
+filter_index = load_filter_index(LEVEL_05_PATH)
+filter_map = {}
+
+on = st.toggle("Activate Filter Options")
+if on:
+    with st.expander("⚙️ Filters", expanded=True):
+        
+        # Each selectbox only offers values still reachable
+        # under the selections made in the other ones
+        filter_map, filter_options = filter_index.cascade({
+            col: st.session_state.get(f"l05_filter_{col}", "All")
+            for col in CUBE_FILTER_COLUMNS
+        })
+        
+        filter_cols = st.columns(len(CUBE_FILTER_COLUMNS))
+        for filter_col, col_name in zip(filter_cols, CUBE_FILTER_COLUMNS):
+            with filter_col:
+                key = f"l05_filter_{col_name}"
+                st.session_state[key] = filter_map[col_name]
+                filter_map[col_name] = st.selectbox(
+                    col_name,
+                    options=["All"] + filter_options[col_name],
+                    key=key,
+                )
+
+weighted = st.toggle("Survey weighted (Multiplier)", key="l05_weighted")
+weight = WEIGHT if weighted else None
+
+# Category views are served from the pre-aggregated cube,
+# its weighted sums stand in for the measures when weighted
+fdf = select_measures(cube.filter(filter_expr(filter_map)), weighted)
+
+if fdf.height == 0:
+    st.warning("No rows match the filters.")
+    st.stop()
 
 with st.expander("📦 Choose Category want to view", expanded=True):
     
@@ -86,22 +115,59 @@ with st.expander("📦 Choose Category want to view", expanded=True):
     
 st.write("---")
 
-category_fn = CATEGORY_FN_MAP[selected_category]   
-category_dict = category_fn()
-cat_df = category_dict_to_dataframe(category_dict, fdf)
+cat_df = category_view(
+    selected_category,
+    fdf,
+    file_fingerprint(LEVEL_05_PATH),
+    filter_map,
+    weighted,
+)
+
+# Only the opened tab is built, its figures come from a cache keyed on
+# (chart id, dataset fingerprint, filter state, weighting, category)
+figure_key = (
+    file_fingerprint(LEVEL_05_PATH),
+    filter_state(filter_map),
+    weighted,
+    selected_category,
+)
 
-tab1, tab2, tab3, tab4, tab5, tab6, tab7 = st.tabs([
+def category_chart(build, data=None):
+    data = cat_df if data is None else data
+    return cached_figure(build.__name__, figure_key, lambda: weighted_title(build(data), weight))
+
+TABS = [
     "Statistic", "Consumption", "Distribution",
     "Qty, Value by Category", "Category", "Avg Qty, Value by Category", 
-    "PCA by Category"
-])
+    "PCA by Category", "Drill-down", "Households"
+]
+
+tab = st.segmented_control(
+    "Tabs",
+    options=TABS,
+    default=TABS[0],
+    key="l05_tab",
+    label_visibility="collapsed",
+) or TABS[0]
 
-with tab1:
-    st.write(f"Total Rows: {df.shape[0]}")
+if tab == "Statistic":
+    # Counts and describe of the filtered rows in one collect_all
+    summary = cached_summary(
+        "BL05",
+        df.lazy().filter(filter_expr(filter_map)),
+        file_fingerprint(LEVEL_05_PATH),
+        filter_map,
+    )
+
+    st.write(f"Total Rows: {summary.rows}")
+    st.write(f"Households: {summary.households}")
     
     with st.expander(label="Statistical Summary"):
         st.subheader("Statistical")
-        st.write(df.describe())
+        st.write(summary.describe)
+
+    with st.expander(label="Category View Cache"):
+        st.write(category_view_cache().stats())
 
     with st.expander(label="Category Dataframe"):   
         st.subheader("Category Dataframe")
@@ -111,17 +177,26 @@ with tab1:
         st.subheader("Original Dataframe")
         st.dataframe(df.head(20))
 
-with tab2:
+    with st.expander(label="Process Memory"):
+        st.dataframe(memory_report({
+            "BL05 table": df,
+            "BL05 consumption cube": cube,
+        }))
+
+    with st.expander(label="Column Memory"):
+        st.dataframe(level_05_column_report(LEVEL_05_PATH))
+
+elif tab == "Consumption":
     st.subheader("Total Consumption")
         
     col1_tb2, col2_tb2 = st.columns(2)
     
     with col1_tb2:
-        fig1 = total_consumption_qty_by_category(cat_df)
+        fig1 = category_chart(total_consumption_qty_by_category)
         st.plotly_chart(fig1)
     
     with col2_tb2:
-        fig2 = total_consumption_value_by_category(cat_df)
+        fig2 = category_chart(total_consumption_value_by_category)
         st.plotly_chart(fig2)
     
     st.write("---")
@@ -130,48 +205,48 @@ with tab2:
     col1_tb2, col2_tb2 = st.columns(2)
     
     with col1_tb2:
-        fig11 = out_of_home_consumption_qty_by_category(cat_df)
+        fig11 = category_chart(out_of_home_consumption_qty_by_category)
         st.plotly_chart(fig11)
     
     with col2_tb2:
-        fig22 = out_of_home_consumption_value_by_category(cat_df)
+        fig22 = category_chart(out_of_home_consumption_value_by_category)
         st.plotly_chart(fig22)
     
-with tab3:
+elif tab == "Distribution":
     st.subheader("Distribution of Metrics by Category")
-    fig3 = distribution_of_metric_by_categories(cat_df)
+    fig3 = category_chart(distribution_of_metric_by_categories)
     st.plotly_chart(fig3)
 
-with tab4:
+elif tab == "Qty, Value by Category":
     st.subheader("Total Qty, Value by Category")
     tb4_col1, tb4_col2 = st.columns(2)
     with tb4_col1:
-        fig4 = total_qty_vs_total_value_by_category(cat_df)
+        fig4 = category_chart(total_qty_vs_total_value_by_category)
         st.plotly_chart(fig4)
     
     with tb4_col2:
-        fig5 = total_qty_vs_avg_price_by_category(cat_df)
+        fig5 = category_chart(total_qty_vs_avg_price_by_category)
         st.plotly_chart(fig5)
         
     st.write("---")
     st.subheader("Out of Home Qty, Value by Category")
     tb4_col1, tb4_col2 = st.columns(2)
     with tb4_col1:
-        fig41 = out_of_home_qty_vs_out_of_home_value_by_category(cat_df)
+        fig41 = category_chart(out_of_home_qty_vs_out_of_home_value_by_category)
         st.plotly_chart(fig41)
     
     with tb4_col2:
-        fig51 = out_of_home_qty_vs_out_of_home_avg_price_by_category(cat_df)
+        fig51 = category_chart(out_of_home_qty_vs_out_of_home_avg_price_by_category)
         st.plotly_chart(fig51)
     
-with tab5:
+elif tab == "Category":
     st.subheader("Out of Home vs Total Qty by Category")
     tab5_col1, tab5_col2 = st.columns([1, 2])
     with tab5_col1:
         qty_df = group_bar_chart_qty_type(cat_df)
         st.dataframe(qty_df)
     with tab5_col2:
-        fig6 = out_of_home_vs_total_qty_by_category(qty_df)
+        fig6 = category_chart(out_of_home_vs_total_qty_by_category, qty_df)
         st.plotly_chart(fig6)
 
     st.write("---")
@@ -182,26 +257,78 @@ with tab5:
         st.dataframe(val_df)
   
     with tab5_col2:
-        fig7 = out_of_home_vs_total_value_stack_graph(val_df)
+        fig7 = category_chart(out_of_home_vs_total_value_stack_graph, val_df)
         st.plotly_chart(fig7)
 
-with tab6:
+elif tab == "Avg Qty, Value by Category":
     tb6_c1, tb6_c2 = st.columns(2)
     
     with tb6_c1:
-        fig8 = total_consumption_pattern_by_category(cat_df)
+        fig8 = category_chart(total_consumption_pattern_by_category)
         st.plotly_chart(fig8)
     
     with tb6_c2:
-        fig9 = out_of_home_consumption_pattern_by_category(cat_df)
+        fig9 = category_chart(out_of_home_consumption_pattern_by_category)
         st.plotly_chart(fig9)
 
-with tab7:
+elif tab == "PCA by Category":
     st.subheader("Category Clustering after PCA")
     
-    loading_status_for_pca()
-        
-    pca_df, _, _ = pca_kmeans_category_clustering(cat_df)
+    st.info("""n_components=2, n_clusters=4 \n
+            No of components for 2 axis PC1 & PC2 
+            No of cluster means all the items \n
+            We Can be divided into parts 
+            Like 1.Easy to access 2.Not easy to access
+            or 1. More used 2. Less used etc.
+            """, icon="ℹ️")
     
-    fig10 = pca_2d_graph(pca_df)
-    st.plotly_chart(fig10)
+    n_clusters = 4
+    if cat_df.height < n_clusters:
+        st.warning("Not enough categories match the filters for PCA & Cluster.")
+    else:
+        reporter = pipeline_status("Train the model")
+            
+        pca_df, _, _ = pca_kmeans_category_clustering(
+            cat_df, n_clusters=n_clusters, _reporter=reporter
+        )
+        
+        with reporter.stage("Figure build", flush=True):
+            fig10 = pca_2d_graph(pca_df)
+        st.plotly_chart(fig10)
+        
+        finish_status(reporter)
+
+elif tab == "Drill-down":
+    st.subheader("Consumption Drill-down")
+    st.caption("Click a family to drill into its items, click the centre to go back up.")
+
+    dd_c1, dd_c2 = st.columns(2)
+    with dd_c1:
+        kind = st.radio("Chart", ["sunburst", "treemap"], horizontal=True)
+    with dd_c2:
+        metric = st.selectbox(
+            "Metric",
+            ["total_value", "out_home_value", "total_qty", "out_home_qty"],
+        )
+
+    rollup = category_rollup(fdf, file_fingerprint(LEVEL_05_PATH), filter_map, weighted)
+    fig11 = cached_figure(
+        f"consumption_drill_down:{kind}:{metric}",
+        figure_key[:3],
+        lambda: weighted_title(consumption_drill_down(rollup, metric, kind), weight),
+    )
+    st.plotly_chart(fig11)
+
+elif tab == "Households":
+    st.subheader("Household Consumption (Level 02 × Level 05)")
+    households = load_households().filter(filter_expr(filter_map))
+    st.write(f"Households: {households.height}")
+
+    st.plotly_chart(cached_figure(
+        "out_of_home_share_by_education",
+        figure_key[:3],
+        lambda: weighted_title(out_of_home_share_by_education(households, weight=weight), weight),
+    ))
+
+    with st.expander(label="Household Dataframe"):
+        st.dataframe(households.head(20))
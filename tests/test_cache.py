@@ -0,0 +1,54 @@
+import pytest
+
+from app import cache
+from app.cache import TTLCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(cache.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_entries_expire_after_ttl(clock):
+    c = TTLCache(maxsize=4, ttl=10)
+    c.set("a", 1)
+
+    clock[0] = 9.9
+    assert c.get("a") == 1
+
+    clock[0] = 10.0
+    assert c.get("a") is None
+    assert c.stats()["size"] == 0
+    assert c.evictions == 1
+
+
+def test_least_recently_used_entry_is_evicted(clock):
+    c = TTLCache(maxsize=2, ttl=10)
+    c.set("a", 1)
+    c.set("b", 2)
+    c.get("a")
+    c.set("c", 3)
+
+    assert c.get("b") is None
+    assert c.get("a") == 1
+    assert c.get("c") == 3
+    assert c.evictions == 1
+
+
+def test_counters(clock):
+    c = TTLCache(maxsize=4, ttl=10)
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return "value"
+
+    for _ in range(3):
+        assert c.get_or_compute("key", compute) == "value"
+
+    stats = c.stats()
+    assert len(calls) == 1
+    assert (stats["hits"], stats["misses"], stats["size"]) == (2, 1, 1)
+    assert stats["hit_rate"] == pytest.approx(2 / 3)
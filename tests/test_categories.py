@@ -0,0 +1,34 @@
+import polars as pl
+import pytest
+
+from app.l05_categories import CATEGORY_FN_MAP, category_lookup, compile_item_lookup
+
+
+@pytest.fixture
+def item_codes():
+    codes = sorted({code for mapping_fn in CATEGORY_FN_MAP.values() for code in mapping_fn()})
+    # Codes of no family, above the table and missing
+    return pl.Series("Item_Code", [*codes, *codes[::3], 0, 999, 5_000, None])
+
+
+@pytest.mark.parametrize("family", CATEGORY_FN_MAP)
+def test_lookup_selects_the_items_of_the_family_filter(item_codes, family):
+    mapping = CATEGORY_FN_MAP[family]()
+    # Baseline: left join on the family mapping, keep the mapped rows
+    expected = sorted(
+        (row, mapping[code])
+        for row, code in enumerate(item_codes)
+        if code in mapping
+    )
+
+    item_lookup = compile_item_lookup(category_lookup())
+    families = item_lookup.items["family"].to_list()
+    labels = item_lookup.items["category_mapped"].to_list()
+    selected = sorted(
+        (row, labels[item_id])
+        for ids in item_lookup.item_ids(item_codes)
+        for row, item_id in enumerate(ids)
+        if item_id >= 0 and families[item_id] == family
+    )
+
+    assert selected == expected
@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+
+from app.l02_cluster import IN_PROCESS_MAX_ROWS, kmeans_executor, kmeans_sweep
+
+KS = [2, 3, 4]
+
+
+@pytest.fixture
+def X():
+    rng = np.random.default_rng(0)
+    return rng.random((IN_PROCESS_MAX_ROWS + 1, 3))
+
+
+def test_pool_sweep_matches_in_process(X):
+    partials = []
+    with kmeans_executor(max_workers=2) as pool:
+        pooled = kmeans_sweep(X, KS, pool=pool, on_result=partials.append)
+    in_process = kmeans_sweep(X, KS)
+
+    assert pooled.ks == KS
+    assert pooled.inertia == pytest.approx(in_process.inertia)
+    for k in KS:
+        np.testing.assert_array_equal(pooled.labels[k], in_process.labels[k])
+
+    # One partial sweep per finished fit but the last, growing
+    assert [len(partial.ks) for partial in partials] == [1, 2]
+    assert set(partials[0].ks) < set(partials[1].ks) < set(KS)
+
+
+def test_ks_above_the_row_count_are_skipped():
+    X = np.random.default_rng(0).random((4, 3))
+
+    assert kmeans_sweep(X, KS).ks == [2, 3]
@@ -0,0 +1,65 @@
+import numpy as np
+import polars as pl
+import pytest
+
+from app.l02_covariance import build_covariance_partials
+from app.loaders import filter_expr
+
+FEATURES = ["x", "y", "z"]
+FILTER_COLUMNS = ["District", "Sector", "Stratum", "Region", "Gender"]
+
+
+@pytest.fixture
+def df():
+    rng = np.random.default_rng(0)
+    n = 2_000
+    district = rng.integers(1, 6, n)
+    x = rng.normal(size=n)
+    return pl.DataFrame({
+        "District": district,
+        "Sector": rng.integers(1, 3, n),
+        "Stratum": rng.integers(1, 4, n),
+        # Constant within a cell, so filtering on it selects whole cells
+        "Region": district % 2,
+        # Varies within a cell, not mergeable
+        "Gender": rng.integers(1, 3, n),
+        "x": x,
+        "y": 2 * x + rng.normal(size=n),
+        "z": pl.Series(rng.integers(0, 10, n)).scatter([3, 50, 700], None),
+    })
+
+
+def test_cell_attributes_exclude_columns_varying_within_a_cell(df):
+    partials = build_covariance_partials(df, FEATURES, FILTER_COLUMNS)
+
+    assert partials.can_merge({"Region": 1, "Sector": 2})
+    assert not partials.can_merge({"Gender": 1})
+
+
+@pytest.mark.parametrize("filter_map", [
+    {},
+    {"District": 3},
+    {"District": 2, "Sector": 1},
+    {"Region": 0, "Stratum": 2},
+    {"Region": "All", "Sector": 2},
+])
+def test_merged_correlation_matches_corr(df, filter_map):
+    partials = build_covariance_partials(df, FEATURES, FILTER_COLUMNS)
+
+    expected = (
+        df.filter(filter_expr(filter_map))
+        .select(pl.col(FEATURES).fill_null(0).cast(pl.Float64))
+        .corr()
+    )
+
+    np.testing.assert_allclose(
+        partials.correlation(filter_map).to_numpy(),
+        expected.to_numpy(),
+        rtol=1e-10,
+    )
+
+
+def test_correlation_is_nan_below_two_rows(df):
+    partials = build_covariance_partials(df, FEATURES, FILTER_COLUMNS)
+
+    assert np.isnan(partials.correlation({"District": 99}).to_numpy()).all()
@@ -0,0 +1,63 @@
+import numpy as np
+import polars as pl
+import pytest
+
+from app.filter_index import build_filter_index
+from app.loaders import filter_expr
+
+COLUMNS = ["district", "sector", "fsu"]
+
+
+@pytest.fixture
+def df():
+    rng = np.random.default_rng(0)
+    n = 1_003
+    fsu = rng.integers(0, 40, n)
+    return pl.DataFrame({
+        # Nested like the survey design: an FSU lies in one district
+        "district": fsu % 7,
+        "sector": pl.Series(rng.integers(1, 3, n)).scatter([5, 17], None),
+        "fsu": fsu,
+    })
+
+
+SELECTIONS = [
+    {},
+    {"district": 3},
+    {"sector": 2},
+    {"fsu": 10},
+    {"district": 3, "sector": 1},
+    {"district": 3, "fsu": 10},
+    {"district": 3, "fsu": 11, "sector": 2},
+    {"district": 99},
+    {"district": "All", "sector": 1},
+]
+
+
+@pytest.mark.parametrize("bitmap_max_values", [0, 8, 1_000])
+@pytest.mark.parametrize("filter_map", SELECTIONS)
+def test_take_matches_filter(df, filter_map, bitmap_max_values):
+    index = build_filter_index(df, COLUMNS, bitmap_max_values=bitmap_max_values)
+
+    assert index.take(df, filter_map).equals(df.filter(filter_expr(filter_map)))
+
+
+@pytest.mark.parametrize("bitmap_max_values", [0, 8, 1_000])
+@pytest.mark.parametrize("filter_map", SELECTIONS)
+def test_options_are_the_reachable_values(df, filter_map, bitmap_max_values):
+    index = build_filter_index(df, COLUMNS, bitmap_max_values=bitmap_max_values)
+    options = index.options(filter_map)
+
+    for col in COLUMNS:
+        others = {k: v for k, v in filter_map.items() if k != col}
+        expected = df.filter(filter_expr(others))[col].drop_nulls().unique().sort().to_list()
+        assert options[col] == expected
+
+
+def test_cascade_resets_unreachable_selections(df):
+    index = build_filter_index(df, COLUMNS, bitmap_max_values=8)
+
+    # FSU 10 lies in district 3, so district 4 cannot be combined with it
+    filter_map, _ = index.cascade({"district": 4, "fsu": 10, "sector": "All"})
+
+    assert "All" in (filter_map["district"], filter_map["fsu"])
@@ -0,0 +1,36 @@
+import polars as pl
+import pytest
+
+from app.keys import HOUSEHOLD_KEY_FIELDS, check_key_fields, household_id
+from app.loaders import scan_source
+
+KEYS = pl.DataFrame({
+    "FSU_Serial_No": [1, 1, 1, 2],
+    "Sample_SU_No": [1, 1, 2, 1],
+    "Sample_Sub_Division_No": [None, 1, None, None],
+    "Second_Stage_Stratum_No": [1, 1, 1, 1],
+    "Sample_Household_No": [1, 1, 1, 1],
+})
+
+
+def test_household_ids_are_distinct_and_sort_like_the_keys():
+    ids = KEYS.select(household_id())["household_id"]
+
+    assert ids.n_unique() == KEYS.height
+    assert ids.is_sorted()
+
+
+def test_check_key_fields_rejects_a_field_wider_than_its_bits():
+    too_wide = KEYS.with_columns(pl.lit(256).alias("Sample_Household_No"))
+
+    check_key_fields(KEYS.lazy(), HOUSEHOLD_KEY_FIELDS)
+    with pytest.raises(ValueError, match="Sample_Household_No"):
+        check_key_fields(too_wide.lazy(), HOUSEHOLD_KEY_FIELDS)
+
+
+def test_scan_source_checks_the_key_fields(tmp_path):
+    path = tmp_path / "too_wide.parquet"
+    KEYS.with_columns(pl.lit(1 << 20).alias("FSU_Serial_No")).write_parquet(path)
+
+    with pytest.raises(ValueError, match="FSU_Serial_No"):
+        scan_source(path, HOUSEHOLD_KEY_FIELDS)
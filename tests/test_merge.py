@@ -0,0 +1,50 @@
+import polars as pl
+
+from app.merge import lookup_households, merge_households
+
+
+def persons():
+    # Households 1 and 2 have two members, 3 has no consumption rows
+    return pl.DataFrame({
+        "household_id": [1, 1, 2, 2, 3],
+        "District": [1, 1, 1, 1, 2],
+        "Sector": [1, 1, 2, 2, 1],
+        "NSS_Region": [1, 1, 1, 1, 1],
+        "Stratum": [1, 1, 1, 1, 1],
+        "Sub_sample": [1, 1, 2, 2, 1],
+        "Multiplier": [100, 100, 200, 200, 300],
+        "Relation_to_Head": [1, 2, 2, 1, 1],
+        "Years_of_Education": [10, 4, 0, 12, 8],
+        "Used_Internet_Last_30_Days": [1, 2, 2, 1, 1],
+        "Education_Level": [5, 2, 1, 6, 4],
+        "Education_Level_label": ["a", "b", "c", "d", "e"],
+    }, schema_overrides={"household_id": pl.UInt64})
+
+
+def items():
+    # Household 4 is not in Level 02, 159 is the pulses sub-total line
+    return pl.DataFrame({
+        "household_id": [1, 1, 1, 2, 4],
+        "Item_Code": [140, 160, 159, 140, 140],
+        "Total_Consumption_Value": [10.0, 30.0, 10.0, 5.0, 7.0],
+        "OutOfHome_Consumption_Value": [1.0, 0.0, 1.0, 5.0, 7.0],
+    }, schema_overrides={"household_id": pl.UInt64})
+
+
+def test_merge_keeps_one_row_per_household_in_both_levels():
+    households = merge_households(persons().lazy(), items().lazy())
+
+    assert households["household_id"].to_list() == [1, 2]
+    assert households["household_size"].to_list() == [2, 2]
+    assert households["total_value"].to_list() == [40.0, 5.0]
+    assert households["out_of_home_share"].to_list() == [1.0 / 40.0, 1.0]
+    # Education of the head, not of the first member
+    assert households["head_education_level"].to_list() == [5, 6]
+
+
+def test_lookup_skips_unknown_and_repeated_ids():
+    households = merge_households(persons().lazy(), items().lazy())
+
+    found = lookup_households(households, [2, 3, 1, 2, 4, 99])
+
+    assert found["household_id"].to_list() == [1, 2]
@@ -0,0 +1,47 @@
+import numpy as np
+import polars as pl
+import pytest
+from sklearn.decomposition import PCA
+from sklearn.preprocessing import StandardScaler
+
+from app.l02_pca import feature_batches, fit_streaming_pca
+
+FEATURES = ["a", "b", "c", "d"]
+
+
+@pytest.fixture
+def lf(tmp_path):
+    rng = np.random.default_rng(0)
+    n = 1_000
+    a = rng.normal(10, 3, n)
+    df = pl.DataFrame({
+        "a": a,
+        "b": a + rng.normal(size=n),
+        "c": rng.integers(0, 5, n),
+        "d": pl.Series(rng.exponential(2, n)).scatter([1, 20, 300], None),
+    })
+    path = tmp_path / "features.parquet"
+    df.write_parquet(path)
+    return pl.scan_parquet(path)
+
+
+def test_streaming_pca_matches_sklearn(lf):
+    batch_size = 128
+    assert len(list(feature_batches(lf, FEATURES, batch_size))) > 1
+
+    model = fit_streaming_pca(lf, FEATURES, n_components=3, batch_size=batch_size)
+
+    X = lf.select(FEATURES).fill_null(0).collect().to_numpy().astype(np.float64)
+    scaler = StandardScaler().fit(X)
+    pca = PCA(3).fit(scaler.transform(X))
+
+    # Eigenvectors are only defined up to sign
+    signs = np.sign((model.components_ * pca.components_).sum(axis=1))
+    np.testing.assert_allclose(model.components_ * signs[:, None], pca.components_, atol=1e-10)
+    np.testing.assert_allclose(model.explained_variance_, pca.explained_variance_, rtol=1e-10)
+    np.testing.assert_allclose(model.explained_variance_ratio_, pca.explained_variance_ratio_, rtol=1e-10)
+    np.testing.assert_allclose(
+        model.transform(X) * signs,
+        pca.transform(scaler.transform(X)),
+        atol=1e-9,
+    )
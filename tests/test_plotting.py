@@ -0,0 +1,65 @@
+import numpy as np
+import polars as pl
+import pytest
+
+from app.plotting import box_figure, box_stats
+
+
+def test_box_stats_of_an_empty_frame():
+    df = pl.DataFrame({
+        "Age": pl.Series([], dtype=pl.UInt8),
+        "Multiplier": pl.Series([], dtype=pl.UInt32),
+    })
+
+    assert box_stats(df, "Age").height == 0
+    assert box_stats(df, "Age", weight="Multiplier").height == 0
+
+
+def test_box_stats_fences_and_outliers():
+    stats = box_stats(pl.DataFrame({"Age": [1, 2, 3, 50]}), "Age")
+
+    assert stats["lowerfence"][0] == 1
+    assert stats["upperfence"][0] == 3
+    assert stats["outliers"][0].to_list() == [50]
+
+
+def test_box_figure_with_a_null_colour():
+    df = pl.DataFrame({
+        "Age": [10, 20, 30, 40, 50, 60],
+        "Sector": [1, 1, 2, 2, 1, 2],
+        "Gender": ["F", "M", None, "F", None, "M"],
+    })
+
+    fig = box_figure(df, "Age", x="Sector", color="Gender")
+    boxes = [trace for trace in fig.data if trace.type == "box"]
+
+    assert sorted(trace.name for trace in boxes) == ["F", "M", "None"]
+    assert sum(len(trace.x) for trace in boxes) == box_stats(df, "Age", by=["Sector", "Gender"]).height
+
+
+def brute_force_weighted_quantile(values, weights, q):
+    # Smallest value whose cumulative weight reaches q of the total
+    for v in sorted(set(values)):
+        if sum(w for x, w in zip(values, weights) if x <= v) >= q * sum(weights):
+            return v
+
+
+def test_weighted_box_stats_quartiles():
+    rng = np.random.default_rng(0)
+    df = pl.DataFrame({
+        "Age": pl.Series(rng.integers(0, 30, 200)).scatter([3, 40], None),
+        "Sector": rng.integers(1, 3, 200),
+        "Multiplier": rng.integers(1, 1_000, 200),
+    })
+
+    stats = box_stats(df, "Age", by=["Sector"], weight="Multiplier")
+
+    for sector, q1, median, q3 in stats.select("Sector", "q1", "median", "q3").iter_rows():
+        rows = df.filter(pl.col("Sector") == sector).drop_nulls("Age")
+        values, weights = rows["Age"].to_list(), rows["Multiplier"].to_list()
+        assert [q1, median, q3] == [
+            brute_force_weighted_quantile(values, weights, q) for q in (0.25, 0.5, 0.75)
+        ]
+        assert stats.filter(pl.col("Sector") == sector)["mean"][0] == pytest.approx(
+            np.average(values, weights=weights)
+        )
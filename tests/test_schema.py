@@ -0,0 +1,16 @@
+import polars as pl
+
+from app.schema import downcast
+
+
+def test_downcast_narrows_codes_and_keeps_measures_wide():
+    df = pl.DataFrame({
+        "District": pl.Series([1, 38], dtype=pl.Int64),
+        "Multiplier": pl.Series([3_000_000_000, 3_000_000_000], dtype=pl.Int64),
+    })
+
+    result = downcast(df)
+
+    assert result["District"].dtype == pl.UInt8
+    assert result["Multiplier"].dtype == pl.Int64
+    assert result["Multiplier"].sum() == 6_000_000_000
@@ -0,0 +1,71 @@
+import numpy as np
+import polars as pl
+import pytest
+
+from app.l02_sketches import build_distribution_sketches, histogram_box_stats, histogram_counts
+from app.loaders import filter_expr
+from app.plotting import box_stats
+from app.variance import subsample_estimates
+from app.weights import weight_of
+
+FILTER_COLUMNS = ["District", "Sector", "Stratum"]
+COLUMNS = ["Age", "Years_of_Education"]
+
+
+def row_value_counts(df, col, weight=None):
+    # Reference: counted from the rows
+    count = pl.len() if weight is None else weight_of(weight).sum()
+    return subsample_estimates(df, [col], totals={"count": count})
+
+
+@pytest.fixture
+def df():
+    rng = np.random.default_rng(0)
+    n = 3_000
+    return pl.DataFrame({
+        "District": rng.integers(1, 4, n),
+        "Sector": rng.integers(1, 3, n),
+        "Stratum": rng.integers(1, 3, n),
+        "Sub_sample": rng.integers(1, 3, n),
+        "Age": pl.Series(rng.integers(0, 90, n)).scatter([7, 70], None),
+        "Years_of_Education": pl.Series(rng.poisson(6, n)).scatter([5], None),
+        "Multiplier": rng.integers(100, 100_000, n),
+    })
+
+
+# Two cells (both strata of one district and sector), then several
+FILTERS = [
+    {"District": 2, "Sector": 1},
+    {"Sector": 2},
+]
+
+
+@pytest.mark.parametrize("weight", [None, "Multiplier"])
+@pytest.mark.parametrize("filter_map", FILTERS)
+@pytest.mark.parametrize("col", COLUMNS)
+def test_merged_box_stats_match_the_rows(df, col, filter_map, weight):
+    sketches = build_distribution_sketches(df, FILTER_COLUMNS)
+    rows = df.filter(filter_expr(filter_map))
+
+    merged = histogram_box_stats(sketches.histogram(col, filter_map), col, weight)
+    expected = box_stats(rows, col, weight=weight)
+
+    for stat in ["q1", "median", "q3", "mean", "lowerfence", "upperfence"]:
+        assert merged[stat][0] == pytest.approx(expected[stat][0]), stat
+    assert merged["count"][0] == expected["count"][0]
+    assert sorted(merged["outliers"][0]) == sorted(set(expected["outliers"][0]))
+
+
+@pytest.mark.parametrize("weight", [None, "Multiplier"])
+@pytest.mark.parametrize("filter_map", FILTERS)
+@pytest.mark.parametrize("col", COLUMNS)
+def test_merged_counts_match_the_rows(df, col, filter_map, weight):
+    sketches = build_distribution_sketches(df, FILTER_COLUMNS)
+    rows = df.filter(filter_expr(filter_map))
+
+    merged = histogram_counts(sketches.histogram(col, filter_map), col, weight).sort(col)
+    expected = row_value_counts(rows, col, weight).sort(col)
+
+    assert merged[col].equals(expected[col])
+    np.testing.assert_allclose(merged["count"], expected["count"], rtol=1e-12)
+    np.testing.assert_allclose(merged["count_se"], expected["count_se"], rtol=1e-12)
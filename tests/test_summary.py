@@ -0,0 +1,51 @@
+import numpy as np
+import polars as pl
+import pytest
+
+from app.summary import summary_bundle
+from app.variance import subsample_estimates
+from app.weights import weight_of
+
+COUNT_COLUMNS = ["Age", "Gender_label"]
+
+
+def row_value_counts(df, col, weight=None):
+    # Reference: counted from the rows
+    count = pl.len() if weight is None else weight_of(weight).sum()
+    return subsample_estimates(df, [col], totals={"count": count})
+
+
+@pytest.fixture
+def df():
+    rng = np.random.default_rng(0)
+    n = 500
+    return pl.DataFrame({
+        "household_id": rng.integers(0, 100, n),
+        "Sub_sample": rng.integers(1, 3, n),
+        "Age": pl.Series(rng.integers(0, 20, n)).scatter([4], None),
+        "Gender_label": rng.choice(["Male", "Female"], n),
+        "Multiplier": rng.integers(100, 10_000, n),
+    })
+
+
+@pytest.mark.parametrize("weight", [None, "Multiplier"])
+@pytest.mark.parametrize("col", COUNT_COLUMNS)
+def test_bundle_counts_match_value_counts(df, col, weight):
+    bundle = summary_bundle(df.lazy(), COUNT_COLUMNS)
+
+    counts = bundle.value_counts(col, weight)
+    expected = row_value_counts(df, col, weight).sort(col, nulls_last=True)
+
+    assert counts[col].equals(expected[col])
+    np.testing.assert_allclose(counts["count"], expected["count"], rtol=1e-12)
+    np.testing.assert_allclose(counts["count_se"], expected["count_se"], rtol=1e-12)
+
+
+def test_bundle_totals(df):
+    bundle = summary_bundle(df.lazy(), COUNT_COLUMNS)
+
+    assert bundle.rows == df.height
+    assert bundle.households == df["household_id"].n_unique()
+    assert bundle.describe["Age"].to_list() == pytest.approx(
+        df.select(pl.col("Age").cast(pl.Float64)).describe()["Age"].to_list()
+    )
@@ -0,0 +1,61 @@
+import numpy as np
+import polars as pl
+import pytest
+
+from app.l05_taxonomy import ROOT_ID, TAXONOMY_MEASURES, build_item_taxonomy
+
+MEASURES = list(TAXONOMY_MEASURES.values())
+
+
+@pytest.fixture
+def taxonomy():
+    return build_item_taxonomy()
+
+
+@pytest.fixture
+def fdf(taxonomy):
+    rng = np.random.default_rng(0)
+    # Leaf items, sub-total rows of families with a breakdown and an unknown code
+    codes = [*taxonomy.leaves()["Item_Code"].to_list(), 129, 159, 9_999]
+    item_code = rng.choice(codes, 2_000)
+    return pl.DataFrame({
+        "Item_Code": item_code,
+        **{col: rng.integers(0, 100, len(item_code)) for col in TAXONOMY_MEASURES},
+    })
+
+
+def test_family_totals_are_the_sums_of_their_items(taxonomy, fdf):
+    rollup = taxonomy.rollup(fdf)
+
+    items = (
+        rollup
+        .filter(pl.col("Item_Code").is_not_null())
+        .group_by("parent")
+        .agg(pl.col(MEASURES).sum())
+        .rename({"parent": "id"})
+    )
+    families = rollup.filter(pl.col("parent") == ROOT_ID).select("id", *MEASURES)
+    broken_down = families.join(items, on="id", how="semi")
+
+    assert broken_down.height > 0
+    assert (
+        broken_down.sort("id")
+        .equals(items.filter(pl.col("id") != ROOT_ID).select(broken_down.columns).sort("id"))
+    )
+
+    root = rollup.filter(pl.col("id") == ROOT_ID).select(MEASURES)
+    assert root.equals(families.select(pl.col(MEASURES).sum()))
+
+
+def test_leaves_sum_the_rows_of_their_item_code(taxonomy, fdf):
+    rollup = taxonomy.rollup(fdf)
+    leaves = rollup.filter(pl.col("Item_Code").is_not_null())
+
+    expected = (
+        fdf.group_by("Item_Code")
+        .agg(pl.col(col).sum().alias(name) for col, name in TAXONOMY_MEASURES.items())
+    )
+    joined = leaves.join(expected, on="Item_Code", how="left", suffix="_rows").fill_null(0)
+
+    for name in MEASURES:
+        assert joined[name].equals(joined[f"{name}_rows"], check_names=False)
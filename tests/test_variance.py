@@ -0,0 +1,43 @@
+import polars as pl
+import pytest
+
+from app.variance import subsample_estimates
+
+
+def test_count_se_when_second_sub_sample_is_larger():
+    # 1 row in sub-sample 1 and 3 in sub-sample 2: pl.len() is UInt32
+    df = pl.DataFrame({
+        "group": ["a", "a", "a", "a"],
+        "Sub_sample": [1, 2, 2, 2],
+    })
+
+    result = subsample_estimates(df, ["group"], totals={"count": pl.len()})
+
+    assert result["count"].to_list() == [4]
+    assert result["count_se"].to_list() == [2.0]
+
+
+def test_ratio_se_is_half_the_sub_sample_difference():
+    df = pl.DataFrame({
+        "group": ["a"] * 4,
+        "Sub_sample": [1, 1, 2, 2],
+        "num": [1, 1, 3, 3],
+        "den": [2, 2, 4, 4],
+    })
+
+    result = subsample_estimates(
+        df,
+        ["group"],
+        totals={"num": pl.col("num").sum(), "den": pl.col("den").sum()},
+        ratios={"share": ("num", "den")},
+    )
+
+    assert result["share_se"][0] == pytest.approx(abs(0.5 - 0.75) / 2)
+
+
+def test_se_is_null_with_a_single_sub_sample():
+    df = pl.DataFrame({"group": ["a", "b"], "Sub_sample": [1, 1]})
+
+    result = subsample_estimates(df, ["group"], totals={"count": pl.len()})
+
+    assert result["count_se"].null_count() == 2